@@ -0,0 +1,190 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+
+import compile
+
+BENCH_DIR = "bench_data"
+RESULTS_NAME = "benchmark_results.json"
+
+# rough mix of converting types seen in real CRF096 exports
+TYPES = [
+    ("SLITTING", 68),
+    ("CONVERTING", 23),
+    ("CONVERT2", 3),
+    ("SLIT2", 2),
+    ("ADHECO", 1),
+    ("CONVERT", 1),
+    ("SLIT", 1),
+    ("SLITTER", 1),
+]
+
+# write a synthetic Workorder Late Report with roughly `rows` rows to `path`
+# about 1 in 12 rows is a non-production or unposted row that collect_data skips
+def generate_export(path, rows, years=4, seed=0):
+    rng = random.Random(seed)
+    type_names = [name for name, _ in TYPES]
+    type_weights = [weight for _, weight in TYPES]
+    parts = [(f"Z.{rng.choice('ABCDEFGH')}{rng.randint(1000, 99999)}", f"- PCS,PART {n}, {rng.randint(1, 500)}PCS/BATCH") for n in range(max(rows // 50, 20))]
+    components = [f"{rng.choice(['ML', 'SL.', 'TEL', 'DL', 'GAL.'])}{rng.randint(100, 9999)}" for _ in range(max(rows // 200, 10))]
+
+    end = datetime.datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+    span = years * 365
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(["Workorder Late Report"])
+    ws.append(["WO", "Part", "Description", "Type", "Status", "Post Date", "Due Date", "Qty", "Transaction", "Components"])
+
+    for n in range(rows):
+        part_num, part_desc = rng.choice(parts)
+        post_date = end - datetime.timedelta(days=rng.randint(0, span))
+        # most WOs post around their due date, with a long tail of late ones
+        due_date = post_date - datetime.timedelta(days=int(rng.gauss(-25, 30)))
+
+        fragments = []
+        for component in rng.sample(components, rng.randint(1, 4)):
+            description = "TAPE, 2IN" if rng.random() < 0.2 else "TAPE"
+            fragments.append(f"{component} - {description}")
+        if rng.random() < 0.5:
+            fragments.append(f"{rng.choice(['CONVERTING COST', 'SLITTING COST'])} - {rng.randint(1, 50)}.00")
+
+        transaction = "Record Production" if rng.random() > 0.05 else "Issue Material"
+        status = "Posted" if rng.random() > 0.03 else "Open"
+
+        ws.append([
+            f"W{n:07d}",
+            part_num,
+            part_desc,
+            rng.choices(type_names, type_weights)[0],
+            status,
+            post_date,
+            due_date,
+            max(1, int(rng.lognormvariate(3, 1.2))),
+            transaction,
+            ", ".join(fragments),
+        ])
+
+    wb.save(path)
+
+def synthetic_export(rows, seed):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f"synthetic_{rows}_{seed}.xlsx")
+    if not os.path.exists(path):
+        print(f"Generating {rows} row export")
+        generate_export(path, rows, seed=seed)
+    return path
+
+# run a stage once for wall/CPU time, then again under tracemalloc for peak memory
+def measure(func, memory=True):
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = func()
+    stats = {
+        "wall_s": round(time.perf_counter() - wall, 4),
+        "cpu_s": round(time.process_time() - cpu, 4),
+    }
+
+    if memory:
+        tracemalloc.start()
+        func()
+        stats["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        tracemalloc.stop()
+
+    return result, stats
+
+def collect(path):
+    wb = compile.open_wb(path, read_only=True)
+    data = compile.collect_data(wb)
+    wb.close()
+    return data
+
+def write_json(data, results, components, last_month_results):
+    compile.print_to_json(data, "data")
+    compile.print_to_json(results, "results")
+    compile.print_to_json(components, "components")
+    compile.print_to_json(last_month_results, "last_month")
+
+def write_excel(results, components, last_month_results):
+    report = compile.build_report(results, components, last_month_results)
+    compile.save_report(report, "Workorder Analysis.xlsx")
+
+def run_size(rows, seed, memory):
+    path = os.path.abspath(synthetic_export(rows, seed))
+    stages = {}
+
+    data, stages["collect_data"] = measure(lambda: collect(path), memory)
+    results, stages["summarize"] = measure(lambda: compile.summarize(data), memory)
+    components, stages["summarize_late_components"] = measure(lambda: compile.summarize_late_components(data), memory)
+    last_month_results, stages["analyze_last_month"] = measure(lambda: compile.analyze_last_month(data, 3), memory)
+
+    # outputs go to a scratch directory so benchmark runs don't overwrite real results
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            _, stages["json_output"] = measure(lambda: write_json(data, results, components, last_month_results), memory)
+            _, stages["excel_output"] = measure(lambda: write_excel(results, components, last_month_results), memory)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "rows": rows,
+        "accepted": len(data["raw"]),
+        "stages": stages,
+    }
+
+def load_runs(name):
+    if not os.path.exists(name):
+        return []
+    with open(name, encoding='utf-8') as f:
+        return json.load(f)
+
+# print each stage next to the same stage from the previous run of the same size
+def print_comparison(run, previous_runs):
+    for size in run["sizes"]:
+        previous = None
+        for old_run in reversed(previous_runs):
+            previous = next((old for old in old_run["sizes"] if old["rows"] == size["rows"]), None)
+            if previous:
+                break
+
+        print(f"\n{size['rows']} rows ({size['accepted']} accepted)")
+        for stage, stats in size["stages"].items():
+            line = f"  {stage:<28}{stats['wall_s']:>10.3f}s"
+            if "peak_mb" in stats:
+                line += f"{stats['peak_mb']:>10.1f}MB"
+            if previous and stage in previous["stages"]:
+                line += f"   (was {previous['stages'][stage]['wall_s']:.3f}s)"
+            print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of compile.py on synthetic CRF096 exports")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", default=RESULTS_NAME)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass for each stage")
+    args = parser.parse_args()
+
+    run = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "label": args.label,
+        "sizes": [run_size(rows, args.seed, not args.no_memory) for rows in args.sizes],
+    }
+
+    runs = load_runs(args.output)
+    print_comparison(run, runs)
+    runs.append(run)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(runs, f, indent=4)
+
+if __name__ == "__main__":
+    main()
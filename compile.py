@@ -1,13 +1,138 @@
 import openpyxl
+import numpy as np
 import re
 import datetime
 import calendar
 import json
+import os
+import hashlib
+import pickle
+import glob
+import heapq
+import random
+import math
+import functools
+import gzip
+import time
+import tracemalloc
+import cProfile
+import sys
+import csv
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# bump whenever parse_row/collect_data change what ends up in the parsed data,
+# so cached exports from older parsers are never reused
+PARSER_VERSION = 2
+CACHE_DIR = ".wo_cache"
+CACHE_MAX_BYTES = 500 * 1024 * 1024
+STORE_NAME = "wo_store.pickle"
+
+# a component fragment looks like "CODE - description", the code is everything before " -"
+COMPONENT_PATTERN = re.compile(r'(.*?)(?=\ -)')
+COMPONENT_CACHE_SIZE = 2 ** 16
+# column J fragments that didn't match COMPONENT_PATTERN, across every row parsed so far
+COMPONENT_PARSE_STATS = {"failed": 0}
+
+# quantiles reported by the distribution stats, and the sketch settings behind them
+QUANTILES = [0.5, 0.75, 0.9, 0.99]
+SKETCH_EXACT_SIZE = 2000
+SKETCH_COMPRESSION = 200
+
+# preview runs estimate the summaries from a uniform sample of this many accepted rows,
+# with confidence intervals at PREVIEW_Z standard errors (1.96 for 95%)
+PREVIEW_SAMPLE_SIZE = 5000
+PREVIEW_Z = 1.96
+
+# the report groups main uses; batch variants can swap in their own
+DEFAULT_GROUPS = {"slit": "slit", "convert": "convert"}
+
+# delimiter for each delimited export extension, None means sniff it from the file
+DELIMITED_EXTENSIONS = {".csv": ",", ".tsv": "\t", ".tab": "\t", ".txt": None}
+# date layouts the ERP writes to delimited exports, after ISO which is tried first
+DATE_FORMATS = ["%m/%d/%Y", "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %I:%M:%S %p", "%Y/%m/%d", "%d-%b-%Y"]
+
+# every component code seen so far, so each name is stored once and has an integer id
+COMPONENT_IDS = {}
+COMPONENT_NAMES = []
+# new components are registered under a lock so threads sharing the module (service.py) agree on ids
+COMPONENT_LOCK = threading.Lock()
+
+# per-stage timings and counters, only collected while main runs with profile=True
+PROFILE = {
+    "enabled": False,
+    "cprofile": False,
+    "stages": {},
+    "counters": {},
+}
+
+def start_profile(cprofile=False):
+    PROFILE["enabled"] = True
+    PROFILE["cprofile"] = cprofile
+    PROFILE["stages"] = {}
+    PROFILE["counters"] = {}
+    tracemalloc.start()
+
+# add to a named counter, a no-op unless profiling
+def profile_count(name, amount=1):
+    if PROFILE["enabled"]:
+        PROFILE["counters"][name] = PROFILE["counters"].get(name, 0) + amount
+
+# call func(*args) as a named stage, recording wall time, CPU time, tracemalloc peak
+# and the counters it bumped, and optionally dumping a cProfile of it
+# a stage run more than once accumulates into the same entry
+def run_stage(name, func, *args, **kwargs):
+    if not PROFILE["enabled"]:
+        return func(*args, **kwargs)
+
+    counters_before = dict(PROFILE["counters"])
+    profiler = cProfile.Profile() if PROFILE["cprofile"] else None
+    tracemalloc.reset_peak()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    if profiler:
+        result = profiler.runcall(func, *args, **kwargs)
+    else:
+        result = func(*args, **kwargs)
+
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+
+    stage = PROFILE["stages"].setdefault(name, {"calls": 0, "wall_s": 0, "cpu_s": 0, "peak_mb": 0, "counters": {}})
+    stage["calls"] += 1
+    stage["wall_s"] = round(stage["wall_s"] + wall, 4)
+    stage["cpu_s"] = round(stage["cpu_s"] + cpu, 4)
+    stage["peak_mb"] = round(max(stage["peak_mb"], peak_mb), 2)
+    for counter, total in PROFILE["counters"].items():
+        change = total - counters_before.get(counter, 0)
+        if change:
+            stage["counters"][counter] = stage["counters"].get(counter, 0) + change
+
+    if profiler:
+        profiler.dump_stats(f"profile_{name}.prof")
+
+    return result
+
+# write the collected stages to {name}.json and stop profiling
+def finish_profile(wb_name, name="profile"):
+    tracemalloc.stop()
+    PROFILE["enabled"] = False
+    print_to_json({
+        "wb_name": wb_name,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "stages": PROFILE["stages"],
+        "counters": PROFILE["counters"],
+    }, name)
 
 # open an excel workbook and return an openpyxl workbook instance
-def open_wb(name):
+# read_only streams the sheet instead of loading every cell into memory, but the
+# returned workbook can't be written to
+def open_wb(name, read_only=False):
     try:
-        wb = openpyxl.load_workbook(name)
+        wb = openpyxl.load_workbook(name, read_only=read_only)
         print('Successfully loaded input worksheet')
         return wb
     except Exception as e:
@@ -22,74 +147,583 @@ def create_workbook(name):
     wb = openpyxl.Workbook()
     wb.save(f'{name}.xlsx')
 
-def list_components(str):
-    if str == "":
-        return None
-    raw = str.split(',')
+# the shared copy of a component name, registering it the first time it's seen
+def intern_component(name):
+    return COMPONENT_NAMES[component_id(name)]
+
+def component_id(name):
+    if name not in COMPONENT_IDS:
+        with COMPONENT_LOCK:
+            if name not in COMPONENT_IDS:
+                COMPONENT_NAMES.append(name)
+                COMPONENT_IDS[name] = len(COMPONENT_NAMES) - 1
+    return COMPONENT_IDS[name]
+
+# parse one raw column J string into (component codes, number of fragments that failed)
+# the same strings repeat across thousands of rows, so results are cached by raw string
+@functools.lru_cache(maxsize=COMPONENT_CACHE_SIZE)
+def parse_components(raw_str):
     new = []
-    for component in raw:
-        try:
-            match = re.match(r'(.*?)(?=\ -)', component).group(1).strip()
-            if match != "CONVERTING COST" and match != "SLITTING COST":
-                new.append(match)
-        except Exception as E:
-            # print(E, component, match)
+    failed = 0
+    for component in raw_str.split(','):
+        match = COMPONENT_PATTERN.match(component)
+        if match == None:
+            failed += 1
             continue
-    return new
+        match = match.group(1).strip()
+        if match != "CONVERTING COST" and match != "SLITTING COST":
+            new.append(intern_component(match))
+    return tuple(new), failed
+
+# rows with no components (an empty cell) get None
+def list_components(str):
+    if str == "" or str == None:
+        return None
+    components, failed = parse_components(str)
+    COMPONENT_PARSE_STATS["failed"] += failed
+    return list(components)
 
 def check_if_late(data):
     return data["post_date"] - data["due_date"] > datetime.timedelta(days=0)
 
 def calc_late_duration(data):
+    # whole columns from a table: floor to days the same way timedelta.days does
+    if isinstance(data["post_date"], np.ndarray):
+        return (data["post_date"] - data["due_date"]) // np.timedelta64(1, "D")
     return (data["post_date"] - data["due_date"]).days
 
-def collect_data(wb):
-    ws = wb.active
+# build a work order from one row of export values (columns A-J)
+# returns None for rows that aren't posted production records
+def parse_row(row):
+    if not is_accepted(row):
+        return
+
+    wo_num, part_num, part_desc, wo_type, status, post_date, due_date, qty, transaction, components = row[:10]
+
+    # delimited exports hold text where xlsx cells already hold datetimes and numbers
+    if isinstance(post_date, str):
+        post_date = parse_date(post_date)
+    if isinstance(due_date, str):
+        due_date = parse_date(due_date)
+    if isinstance(qty, str):
+        qty = parse_number(qty)
+
+    row_data = {
+        "wo_num": wo_num,
+        "part_num": part_num,
+        "part_desc": part_desc,
+        "type": wo_type,
+        "status": status,
+        "post_date": post_date,
+        "due_date": due_date,
+        "qty": qty,
+        "components": list_components(components),
+    }
 
+    row_data["late_duration"] = calc_late_duration(row_data)
+
+    if check_if_late(row_data):
+        row_data["is_late"] = True
+
+    else:
+        row_data["is_late"] = False
+
+    return row_data
+
+# whether a row is a posted production record, checked without parsing anything
+def is_accepted(row):
+    return row[8] == "Record Production" and row[4] == "Posted" and row[3] != None
+
+# repeated text like types, statuses and part numbers is shared instead of copied per WO
+def intern_value(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+DAY_MICROSECONDS = 86400 * 1000000
+
+# a datetime as one int of microseconds since day 1 of datetime.toordinal()
+def to_microseconds(date):
+    return date.toordinal() * DAY_MICROSECONDS + ((date.hour * 60 + date.minute) * 60 + date.second) * 1000000 + date.microsecond
+
+def from_microseconds(value):
+    day, microseconds = divmod(value, DAY_MICROSECONDS)
+    return datetime.datetime.fromordinal(day) + datetime.timedelta(microseconds=microseconds)
+
+# a WO stored in a fraction of the memory of the dict parse_row builds
+# dates are kept as single ints (times of day included, see to_microseconds) and
+# late_duration/is_late are worked out from them the same way as for the dict,
+# and wo["field"] still works so every summarizer can use it in place of the dict
+class WorkOrder:
+    __slots__ = ("wo_num", "part_num", "part_desc", "type", "status", "post_time", "due_time", "qty", "components")
+
+    FIELDS = ["wo_num", "part_num", "part_desc", "type", "status", "post_date", "due_date", "qty", "components", "late_duration", "is_late"]
+
+    def __init__(self, wo_num, part_num, part_desc, type, status, post_time, due_time, qty, components):
+        self.wo_num = wo_num
+        self.part_num = intern_value(part_num)
+        self.part_desc = intern_value(part_desc)
+        self.type = intern_value(type)
+        self.status = intern_value(status)
+        self.post_time = post_time
+        self.due_time = due_time
+        self.qty = qty
+        self.components = tuple(components) if components != None else None
+
+    @classmethod
+    def from_dict(cls, wo):
+        return cls(wo["wo_num"], wo["part_num"], wo["part_desc"], wo["type"], wo["status"], to_microseconds(wo["post_date"]), to_microseconds(wo["due_date"]), wo["qty"], wo["components"])
+
+    @property
+    def post_date(self):
+        return from_microseconds(self.post_time)
+
+    @property
+    def due_date(self):
+        return from_microseconds(self.due_time)
+
+    @property
+    # whole days, rounded down like timedelta.days
+    def late_duration(self):
+        return (self.post_time - self.due_time) // DAY_MICROSECONDS
+
+    @property
+    def is_late(self):
+        return self.post_time > self.due_time
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if not isinstance(other, WorkOrder):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f"WorkOrder({self.to_dict()!r})"
+
+    # the same dict parse_row builds, for JSON output
+    def to_dict(self):
+        wo = {field: self[field] for field in self.FIELDS}
+        if wo["components"] != None:
+            wo["components"] = list(wo["components"])
+        return wo
+
+def parse_date(value):
+    value = value.strip()
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date in export: {value!r}")
+
+def parse_number(value):
+    value = value.strip().replace(',', '')
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+# yield the accepted work orders from rows of export values in a single pass
+def stream_values(rows):
+    scanned = 0
+    accepted = 0
+    for row in rows:
+        scanned += 1
+        row_data = parse_row(row)
+        if row_data:
+            accepted += 1
+            yield row_data
+
+    profile_count("rows_scanned", scanned)
+    profile_count("rows_accepted", accepted)
+
+# yield the accepted work orders of a worksheet in a single pass over its rows
+def stream_rows(ws):
+    return stream_values(ws.iter_rows(min_row=1, max_col=10, values_only=True))
+
+def is_delimited(name):
+    return os.path.splitext(name)[1].lower() in DELIMITED_EXTENSIONS
+
+# rows of a CSV/TSV export as the values openpyxl would give for the same cells:
+# empty cells are None, except an empty component cell stays "" like list_components expects
+def read_delimited(name, encoding='utf-8-sig'):
+    delimiter = DELIMITED_EXTENSIONS[os.path.splitext(name)[1].lower()]
+    with open(name, newline='', encoding=encoding) as f:
+        if delimiter == None:
+            delimiter = csv.Sniffer().sniff(f.read(64 * 1024), delimiters=',\t;|').delimiter
+            f.seek(0)
+
+        for row in csv.reader(f, delimiter=delimiter):
+            values = [None if value == "" else value for value in row[:10]]
+            values += [None] * (10 - len(values))
+            if values[9] == None:
+                values[9] = ""
+            yield values
+
+# yield the accepted work orders of a CSV/TSV export without going through openpyxl
+def stream_delimited_rows(name):
+    return stream_values(read_delimited(name))
+
+# gather WOs into the dataset shape the summarizers use
+def build_data(wos):
     all_data = {
         "raw": [],
         "years_seen": []
     }
+    first_date_seen = None
+    last_date_seen = None
+
+    for row_data in wos:
+        post_date = row_data["post_date"]
+        year = post_date.year
+        if year not in all_data["years_seen"]:
+            all_data["years_seen"].append(year)
+
+        if first_date_seen == None or post_date < first_date_seen:
+            first_date_seen = post_date
+        if last_date_seen == None or post_date > last_date_seen:
+            last_date_seen = post_date
+
+        all_data["raw"].append(row_data)
+
+    all_data["first_date_seen"] = first_date_seen
+    all_data["last_date_seen"] = last_date_seen
+    
+    return all_data
+
+# compact_records stores each WO as a WorkOrder instead of a dict
+def collect_data(wb, compact_records=False):
+    return collect_wos(stream_rows(wb.active), compact_records)
+
+# collect_data for a CSV/TSV export of the same report
+def collect_delimited(name, compact_records=False):
+    return collect_wos(stream_delimited_rows(name), compact_records)
+
+def collect_wos(wos, compact_records=False):
+    failed = COMPONENT_PARSE_STATS["failed"]
+    if compact_records:
+        data = build_data(WorkOrder.from_dict(wo) for wo in wos)
+    else:
+        data = build_data(wos)
+    print(f'{COMPONENT_PARSE_STATS["failed"] - failed} component fragments could not be parsed')
+    return data
+
+# sha256 of a file's contents, read in chunks so big exports aren't held in memory
+def hash_file(name):
+    digest = hashlib.sha256()
+    with open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# compact_records exports are cached separately since they hold WorkOrders instead of dicts
+def cache_path(wb_name, compact_records=False):
+    form = ".compact" if compact_records else ""
+    return os.path.join(CACHE_DIR, f"{hash_file(wb_name)}{form}.v{PARSER_VERSION}.pickle")
+
+# return the parsed data for an export if this exact file was parsed before
+def load_cached_data(wb_name, compact_records=False):
+    path = cache_path(wb_name, compact_records)
+    if not os.path.exists(path):
+        return
+
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except Exception as e:
+        print("Exception in load_cached_data", e)
+        os.remove(path)
+        return
+
+    # mark as recently used for evict_cache
+    os.utime(path)
+    print('Loaded parsed data from cache')
+    return data
+
+def save_cached_data(wb_name, data, compact_records=False):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(wb_name, compact_records)
+
+    # write to a temp file first so an interrupted run can't leave a truncated entry
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+    evict_cache()
 
-    for i in range(1, ws.max_row + 1):
-        if ws['I' + str(i)].value != "Record Production":
+# drop entries from older parser versions, then the least recently used entries
+# until the cache fits in max_bytes
+def evict_cache(max_bytes=CACHE_MAX_BYTES):
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    entries = []
+    for file_name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, file_name)
+        if not file_name.endswith(f".v{PARSER_VERSION}.pickle"):
+            os.remove(path)
             continue
-        if ws['E' + str(i)].value != "Posted":
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+# parsed data for an export, from the cache when possible
+# wb can be passed in if the workbook is already open, otherwise it's streamed read-only
+# compact_records loads the WOs as WorkOrders, see collect_data
+def load_data(wb_name, wb=None, compact_records=False):
+    data = run_stage("load_cached_data", load_cached_data, wb_name, compact_records)
+    if data:
+        profile_count("cache_hits")
+        return data
+
+    if wb:
+        data = run_stage("collect_data", collect_data, wb, compact_records)
+    elif is_delimited(wb_name):
+        data = run_stage("collect_data", collect_delimited, wb_name, compact_records)
+    else:
+        wb = run_stage("open_wb", open_wb, wb_name, read_only=True)
+        data = run_stage("collect_data", collect_data, wb, compact_records)
+        wb.close()
+
+    run_stage("save_cached_data", save_cached_data, wb_name, data, compact_records)
+    return data
+
+# inverted indexes from component and part_num to the positions of their WOs in data["raw"]
+# positions are appended in order, so every list is already sorted
+def build_index(data):
+    index = {
+        "components": {},
+        "parts": {},
+    }
+
+    for row_id, wo in enumerate(data["raw"]):
+        for component in wo["components"] or ():
+            rows = index["components"].setdefault(component, [])
+            # a component listed twice on one WO still points at it once
+            if not rows or rows[-1] != row_id:
+                rows.append(row_id)
+
+        index["parts"].setdefault(wo["part_num"], []).append(row_id)
+
+    return index
+
+# WOs using a component and/or part_num, narrowed by the filter_data arguments
+# answered from the index, so only the matching WOs are ever visited
+def query_index(data, index, component=None, part_num=None, converting_type=None, lates_only=True, year=None, month=None):
+    row_ids = None
+    if component != None:
+        row_ids = index["components"].get(component, [])
+    if part_num != None:
+        part_rows = index["parts"].get(part_num, [])
+        row_ids = part_rows if row_ids == None else sorted(set(row_ids).intersection(part_rows))
+    if row_ids == None:
+        row_ids = range(len(data["raw"]))
+
+    wos = filter_data([data["raw"][row_id] for row_id in row_ids], converting_type, lates_only, year, month)
+
+    return {
+        "wos": wos,
+        "qtys": analyze_qty(wos),
+        "late_durations": analyze_late_duration(wos),
+    }
+
+# every .xlsx/.csv/.tsv export in a directory, or every file matching a glob pattern
+def list_exports(path):
+    if os.path.isdir(path):
+        names = glob.glob(os.path.join(path, '*.xlsx'))
+        for extension in DELIMITED_EXTENSIONS:
+            names += glob.glob(os.path.join(path, f'*{extension}'))
+        return sorted(names)
+    return sorted(glob.glob(path))
+
+# parse one export in a worker process
+# workers only read the cache, the parent process writes new entries
+def parse_export(wb_name):
+    data = load_cached_data(wb_name)
+    if data:
+        return wb_name, data, True
+
+    if is_delimited(wb_name):
+        return wb_name, collect_delimited(wb_name), False
+
+    wb = open_wb(wb_name, read_only=True)
+    data = collect_data(wb)
+    wb.close()
+    return wb_name, data, False
+
+# parse many exports in parallel and merge them into one dataset
+# when a WO appears in several exports the latest export wins, where latest means
+# the newest post date in the export, then the newest file modification time
+def collect_exports(path, workers=None):
+    names = list_exports(path)
+    if not names:
+        print(f'No exports found for {path}')
+        return build_data([])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parsed = list(pool.map(parse_export, names))
+
+    for wb_name, data, cached in parsed:
+        if not cached:
+            save_cached_data(wb_name, data)
+
+    parsed.sort(key=lambda item: (item[1]["last_date_seen"] or datetime.datetime.min, os.path.getmtime(item[0])))
+
+    merged = {}
+    for wb_name, data, cached in parsed:
+        for wo in data["raw"]:
+            merged[wo["wo_num"]] = wo
+
+    print(f'Merged {len(merged)} WOs from {len(names)} exports')
+    data = build_data(merged.values())
+    # a replaced WO keeps its first position, which can put a later year first
+    data["years_seen"].sort()
+    return data
+
+# persistent store of every WO merged in so far, grouped by post (year, month)
+# "months" maps (year, month) -> {wo_num: wo}, "index" maps wo_num -> (year, month)
+def load_store(name=STORE_NAME):
+    if not os.path.exists(name):
+        return {"months": {}, "index": {}}
+
+    with open(name, 'rb') as f:
+        return pickle.load(f)
+
+def save_store(store, name=STORE_NAME):
+    with open(name + '.tmp', 'wb') as f:
+        pickle.dump(store, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(name + '.tmp', name)
+
+# merge an export's WOs into the store by wo_num
+# returns the (year, month) buckets that gained, lost or changed a WO
+def merge_into_store(store, data):
+    touched = set()
+
+    for wo in data["raw"]:
+        key = (wo["post_date"].year, wo["post_date"].month)
+        old_key = store["index"].get(wo["wo_num"])
+
+        if old_key:
+            if store["months"][old_key][wo["wo_num"]] == wo:
+                continue
+            touched.add(old_key)
+            del store["months"][old_key][wo["wo_num"]]
+            if not store["months"][old_key]:
+                del store["months"][old_key]
+
+        if key not in store["months"]:
+            store["months"][key] = {}
+        store["months"][key][wo["wo_num"]] = wo
+        store["index"][wo["wo_num"]] = key
+        touched.add(key)
+
+    return touched
+
+DIFF_FIELDS = ["part_num", "part_desc", "type", "status", "post_date", "due_date", "qty", "components", "late_duration", "is_late"]
+
+# {field: [old, new]} for every field that differs between two copies of a WO
+def diff_wo(old, new):
+    changes = {}
+    for field in DIFF_FIELDS:
+        old_value, new_value = old[field], new[field]
+        if field == "components":
+            old_value = list(old_value) if old_value != None else None
+            new_value = list(new_value) if new_value != None else None
+        if old_value != new_value:
+            changes[field] = [old_value, new_value]
+    return changes
+
+# compare two exports' datasets by wo_num with one pass over each
+# returns the added and removed WOs, the changed WOs with their field changes and
+# whether they turned late or on time, and the month totals before and after for
+# only the months those WOs post in
+def diff_exports(old_data, new_data):
+    old_wos = {wo["wo_num"]: wo for wo in old_data["raw"]}
+    new_nums = set()
+    added = []
+    changed = []
+    affected = set()
+
+    for wo in new_data["raw"]:
+        new_nums.add(wo["wo_num"])
+        old = old_wos.get(wo["wo_num"])
+        if old == None:
+            added.append(wo)
+            affected.add(month_index(wo["post_date"].year, wo["post_date"].month))
             continue
-        if ws['D' + str(i)].value == None:
+
+        changes = diff_wo(old, wo)
+        if not changes:
             continue
+        changed.append({
+            "wo_num": wo["wo_num"],
+            "changes": changes,
+            "turned_late": not old["is_late"] and wo["is_late"],
+            "turned_on_time": old["is_late"] and not wo["is_late"],
+        })
+        affected.add(month_index(old["post_date"].year, old["post_date"].month))
+        affected.add(month_index(wo["post_date"].year, wo["post_date"].month))
+
+    removed = [wo for wo in old_data["raw"] if wo["wo_num"] not in new_nums]
+    for wo in removed:
+        affected.add(month_index(wo["post_date"].year, wo["post_date"].month))
 
-        wo_num = ws['A' + str(i)].value
-        row_data = {
-            "wo_num": ws['A' + str(i)].value,
-            "part_num": ws['B' + str(i)].value,
-            "part_desc": ws['C' + str(i)].value,
-            "type": ws['D' + str(i)].value,
-            "status": ws['E' + str(i)].value,
-            "post_date": ws['F' + str(i)].value,
-            "due_date": ws['G' + str(i)].value,
-            "qty": ws['H' + str(i)].value,
-            "components": list_components(ws['J' + str(i)].value),
-        }
+    return {
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "turned_late": [change["wo_num"] for change in changed if change["turned_late"]],
+        "months": diff_month_totals(old_data, new_data, affected),
+    }
 
-        row_data["late_duration"] = calc_late_duration(row_data)
+# old, new and changed month totals for each converting group, keyed by "Month Year"
+def diff_month_totals(old_data, new_data, months):
+    old_totals = monthly_totals(wo for wo in old_data["raw"] if month_index(wo["post_date"].year, wo["post_date"].month) in months)
+    new_totals = monthly_totals(wo for wo in new_data["raw"] if month_index(wo["post_date"].year, wo["post_date"].month) in months)
+    empty = [[0] * len(CUBE_MEASURES) for _ in CUBE_GROUPS]
 
-        if check_if_late(row_data):
-            row_data["is_late"] = True
+    stats = {}
+    for idx in sorted(months):
+        old, new = old_totals.get(idx, empty), new_totals.get(idx, empty)
+        period = f"{calendar.month_name[idx % 12 + 1]} {idx // 12}"
+        stats[period] = {
+            converting_type: {
+                measure: {"old": old[group][n], "new": new[group][n], "change": new[group][n] - old[group][n]}
+                for n, measure in enumerate(CUBE_MEASURES)
+            }
+            for group, converting_type in enumerate(CUBE_GROUPS)
+        }
 
-        else:
-            row_data["is_late"] = False
+    return stats
 
-        year = row_data["post_date"].year
-        if year not in all_data["years_seen"]:
-            all_data["years_seen"].append(year)
-        
-        all_data["raw"].append(row_data)
+# the WOs in the store in the same shape collect_data returns
+# years limits raw to those years, but the date range always covers the whole store
+def store_data(store, years=None):
+    keys = sorted(store["months"])
+    if not keys:
+        return {"raw": [], "years_seen": [], "first_date_seen": None, "last_date_seen": None}
 
-    all_data["first_date_seen"] = sorted([wo["post_date"] for wo in all_data["raw"]])[0]
-    all_data["last_date_seen"] = sorted([wo["post_date"] for wo in all_data["raw"]])[-1]
-    
-    return all_data
+    raw = []
+    for key in keys:
+        if years == None or key[0] in years:
+            raw.extend(store["months"][key].values())
+
+    return {
+        "raw": raw,
+        "years_seen": sorted(set(wo["post_date"].year for wo in raw)),
+        "first_date_seen": min(wo["post_date"] for wo in store["months"][keys[0]].values()),
+        "last_date_seen": max(wo["post_date"] for wo in store["months"][keys[-1]].values()),
+    }
 
 def contains(word, str):
     try:
@@ -97,6 +731,68 @@ def contains(word, str):
     except Exception as e:
         print (word, str)
 
+# converting_type is a type substring, or a list of substrings any of which can match
+def matches_type(converting_type, wo_type):
+    if isinstance(converting_type, str):
+        return contains(converting_type, wo_type) == True
+    return any(contains(word, wo_type) == True for word in converting_type)
+
+# columnar copy of a WO list: one numpy array per field, with type/status stored
+# as codes into the "types"/"statuses" name lists
+# preview runs use it to estimate many slices of one small sample with boolean masks
+def build_table(data):
+    types = {}
+    statuses = {}
+    type_codes = [types.setdefault(wo["type"], len(types)) for wo in data]
+    status_codes = [statuses.setdefault(wo["status"], len(statuses)) for wo in data]
+
+    table = {
+        "types": list(types),
+        "statuses": list(statuses),
+        "wo_num": np.array([wo["wo_num"] for wo in data], dtype=object),
+        "part_num": np.array([wo["part_num"] for wo in data], dtype=object),
+        "part_desc": np.array([wo["part_desc"] for wo in data], dtype=object),
+        "type": np.array(type_codes, dtype=np.int16),
+        "status": np.array(status_codes, dtype=np.int16),
+        "post_date": np.array([wo["post_date"] for wo in data], dtype="datetime64[s]"),
+        "due_date": np.array([wo["due_date"] for wo in data], dtype="datetime64[s]"),
+        # keep whatever numeric type the export used so sums stay exact
+        "qty": np.array([wo["qty"] for wo in data]) if data else np.array([], dtype=np.int64),
+        "components": np.empty(len(data), dtype=object),
+    }
+    table["components"][:] = [wo["components"] for wo in data]
+
+    table["late_duration"] = calc_late_duration(table).astype(np.int64)
+    table["is_late"] = table["post_date"] - table["due_date"] > np.timedelta64(0, "s")
+
+    months = table["post_date"].astype("datetime64[M]").astype(np.int64)
+    table["year"] = (months // 12 + 1970).astype(np.int16)
+    table["month"] = (months % 12 + 1).astype(np.int8)
+
+    return table
+
+def table_size(table):
+    return len(table["qty"])
+
+# boolean mask of the rows in a table that match the filter_data arguments
+def table_mask(table, converting_type=None, lates_only=False, year=None, month=None):
+    mask = np.ones(table_size(table), dtype=bool)
+
+    if year != None:
+        mask &= table["year"] == year
+
+    if month != None:
+        mask &= table["month"] == month
+
+    if lates_only:
+        mask &= table["is_late"]
+
+    if converting_type != None:
+        codes = [code for code, name in enumerate(table["types"]) if contains(converting_type, name) == True]
+        mask &= np.isin(table["type"], codes)
+
+    return mask
+
 def filter_data(data, converting_type=None, lates_only=False, year=None, month=None):
     
     if year != None:
@@ -113,112 +809,338 @@ def filter_data(data, converting_type=None, lates_only=False, year=None, month=N
 
     return data
     
-def analyze_qty(data):
-    qtys = sorted([wo["qty"] for wo in data])
-    
-    if len(qtys) <= 0:
-        return 
+# bucket every WO once by (year, month, type, is_late) so summaries can be built
+# without rescanning the full list for every filter combination
+def group_data(data):
+    buckets = {}
+    for wo in data:
+        key = (wo["post_date"].year, wo["post_date"].month, wo["type"], wo["is_late"])
+        if key in buckets:
+            buckets[key].append(wo)
+        else:
+            buckets[key] = [wo]
 
-    return {
-        "wo_count": len(qtys),
-        "sum": sum(qtys),
-        "avg": round(sum(qtys)/len(qtys),0),
-        "median": qtys[int(len(qtys)/2)]
-    }
+    return buckets
+
+# same filters as filter_data, but applied per bucket instead of per WO
+def filter_buckets(buckets, converting_type=None, lates_only=False, year=None, month=None):
+    data = []
+    for (wo_year, wo_month, wo_type, is_late), wos in buckets.items():
+        if year != None and wo_year != year:
+            continue
+        if month != None and wo_month != month:
+            continue
+        if lates_only and is_late != True:
+            continue
+        if converting_type != None and not matches_type(converting_type, wo_type):
+            continue
+        data.extend(wos)
+
+    profile_count("filter_buckets_calls")
+    profile_count("filter_buckets_elements", len(data))
+    return data
+
+# split a dataset's WOs by post (year, month), keeping their order within each month
+def partition_data(data):
+    partitions = {}
+    for wo in data:
+        key = (wo["post_date"].year, wo["post_date"].month)
+        if key in partitions:
+            partitions[key].append(wo)
+        else:
+            partitions[key] = [wo]
+    return partitions
+
+# a lazy, composable filter over a dataset's WOs
+# each method returns a new query with one more predicate; nothing is scanned until
+# rows() (or a terminal like analyze_qty) is called, and then every predicate is checked
+# in one pass that skips whole (year, month) partitions where it can
+# results are cached per set of predicates, so repeating a query is free
+# it's a standalone API for ad hoc drill-downs; summarize keeps using group_data buckets
+class WorkOrderQuery:
+    def __init__(self, source, predicates=()):
+        self.source = source
+        self.predicates = predicates
+
+    @classmethod
+    def from_data(cls, data):
+        return cls({"raw": data["raw"], "partitions": None, "cache": {}})
+
+    def where(self, name, value):
+        return WorkOrderQuery(self.source, tuple(sorted(self.predicates + ((name, value),), key=repr)))
+
+    def type(self, converting_type):
+        return self.where("type", converting_type)
+
+    def late(self):
+        return self.where("late", True)
+
+    def year(self, year):
+        return self.where("year", year)
+
+    def month(self, month):
+        return self.where("month", month)
+
+    # post dates from start to end, inclusive; either end can be None
+    # dates are widened to datetimes covering the whole day, since post dates are datetimes
+    def between(self, start=None, end=None):
+        if isinstance(start, datetime.date) and not isinstance(start, datetime.datetime):
+            start = datetime.datetime.combine(start, datetime.time.min)
+        if isinstance(end, datetime.date) and not isinstance(end, datetime.datetime):
+            end = datetime.datetime.combine(end, datetime.time.max)
+        return self.where("between", (start, end))
+
+    def part(self, part_num):
+        return self.where("part", part_num)
+
+    def component(self, component):
+        return self.where("component", component)
+
+    # whether any WO in the (year, month) partition could match
+    def partition_matches(self, year, month):
+        for name, value in self.predicates:
+            if name == "year" and year != value:
+                return False
+            if name == "month" and month != value:
+                return False
+            if name == "between":
+                start, end = value
+                if start != None and datetime.datetime(year, month, 1) < datetime.datetime(start.year, start.month, 1):
+                    return False
+                if end != None and datetime.datetime(year, month, 1) > end:
+                    return False
+        return True
+
+    def row_matches(self, wo):
+        for name, value in self.predicates:
+            if name == "type" and contains(value, wo["type"]) != True:
+                return False
+            if name == "late" and not wo["is_late"]:
+                return False
+            if name == "between":
+                start, end = value
+                if start != None and wo["post_date"] < start:
+                    return False
+                if end != None and wo["post_date"] > end:
+                    return False
+            if name == "part" and wo["part_num"] != value:
+                return False
+            if name == "component" and value not in (wo["components"] or ()):
+                return False
+        return True
+
+    # the matching WOs, in partition order
+    def rows(self):
+        cache = self.source["cache"]
+        if self.predicates in cache:
+            return cache[self.predicates]
+
+        if self.source["partitions"] == None:
+            self.source["partitions"] = partition_data(self.source["raw"])
+
+        rows = []
+        for (year, month), wos in self.source["partitions"].items():
+            if not self.partition_matches(year, month):
+                continue
+            rows.extend(wo for wo in wos if self.row_matches(wo))
+
+        cache[self.predicates] = rows
+        return rows
+
+    def count(self):
+        return len(self.rows())
+
+    def analyze_qty(self):
+        return analyze_qty(self.rows())
+
+    def analyze_late_duration(self):
+        return analyze_late_duration(self.rows())
+
+def analyze_qty(data):
+    return analyze_values([wo["qty"] for wo in data])
 
 def analyze_late_duration(data):
-    late_durations = sorted([wo["late_duration"] for wo in data])
+    return analyze_values([wo["late_duration"] for wo in data])
+
+# count, sum, average and median of a list of qtys or late durations
+def analyze_values(values):
+    values = sorted(values)
     
-    if len(late_durations) <= 0:
+    if len(values) <= 0:
         return 
 
     return {
-        "wo_count": len(late_durations),
-        "sum": sum(late_durations),
-        "avg": round(sum(late_durations)/len(late_durations),0),
-        "median": late_durations[int(len(late_durations)/2)]
+        "wo_count": len(values),
+        "sum": sum(values),
+        "avg": round(sum(values)/len(values),0),
+        "median": values[int(len(values)/2)]
     }
 
-# groups all the WOs between the previous month and the # of months preceeding
-def rolling_range(data, months):
-    # make a date range from the end of last month to 3 months ago
-    end = add_months(datetime.datetime.today(), -1) 
-    # go to the last day of the month
-    end = end.replace(day=calendar.monthrange(end.year, end.month)[1])
-    start = add_months(end, -(months-1))
+CUBE_GROUPS = ["total", "slit", "convert"]
+CUBE_MEASURES = ["wo_count", "qty", "late_count", "late_qty", "late_duration"]
 
-    rolling = [wo for wo in data if wo["post_date"] >= start and wo["post_date"] <= end]
+def month_index(year, month):
+    return year * 12 + month - 1
 
-    return rolling
+# per-month totals for each converting group, stored as running sums over the months
+# so any window of months can be summed with one subtraction
+# prefix[i] holds the totals of every month before start + i, shaped (group, measure)
+def build_monthly_cube(data):
+    return cube_from_monthly(monthly_totals(data["raw"]))
 
+# {month_index: [[measure, ...] for each group]} totals of the given WOs
+def monthly_totals(wos):
+    monthly = {}
+    for wo in wos:
+        idx = month_index(wo["post_date"].year, wo["post_date"].month)
+        if idx not in monthly:
+            monthly[idx] = [[0] * len(CUBE_MEASURES) for _ in CUBE_GROUPS]
 
-# get the stats just for the previous month and compare against the rolling average # of months
-def analyze_last_month(data, rolling_duration):
-    wo_list = data["raw"]
-    stats = {
-        "total": {},
-        "slit": {},
-        "convert": {},
+        for group, converting_type in enumerate(CUBE_GROUPS):
+            if converting_type != "total" and contains(converting_type, wo["type"]) != True:
+                continue
+            totals = monthly[idx][group]
+            totals[0] += 1
+            totals[1] += wo["qty"]
+            if wo["is_late"]:
+                totals[2] += 1
+                totals[3] += wo["qty"]
+                totals[4] += wo["late_duration"]
+
+    return monthly
+
+# prefix sums over {month_index: [[measure, ...] for each group]} month totals
+def cube_from_monthly(monthly, groups=CUBE_GROUPS):
+    if not monthly:
+        return {"start": 0, "prefix": np.zeros((1, len(groups), len(CUBE_MEASURES)), dtype=np.int64)}
+
+    start = min(monthly)
+    empty = [[0] * len(CUBE_MEASURES) for _ in groups]
+    months = np.array([empty] + [monthly.get(idx, empty) for idx in range(start, max(monthly) + 1)])
+
+    return {
+        "start": start,
+        "prefix": np.cumsum(months, axis=0),
     }
 
-    # gather all WOs from the month previous to todays date
-    last_month = add_months(datetime.datetime.today(),-1) 
-    last_mo_data = filter_data(wo_list, year=last_month.year, month=last_month.month)
+# totals for the months from first to last (inclusive month indexes), shaped (group, measure)
+def cube_window(cube, first, last):
+    size = len(cube["prefix"]) - 1
+    first = min(max(first - cube["start"], 0), size)
+    last = min(max(last - cube["start"] + 1, 0), size)
+    if last <= first:
+        return np.zeros(cube["prefix"].shape[1:], dtype=cube["prefix"].dtype)
+    return cube["prefix"][last] - cube["prefix"][first]
 
-    # gather all WOs from all the months included in the rolling_duration
-    rolling_data = rolling_range(wo_list, rolling_duration)
-    
-    for converting_type in stats.keys():
-        stats[converting_type] = {}
-        for period in [f"{calendar.month_name[last_month.month]} {last_month.year}", f"Rolling_{rolling_duration}mo"]:
-            # use the last month WOs by default
-            period_data = last_mo_data
-
-            # switch to the rolling WOs for rolling stats
-            if period == f"Rolling_{rolling_duration}mo":
-                period_data = rolling_data
-            
-            qty_stats = analyze_qty(filter_data(period_data, converting_type=converting_type if converting_type != "total" else None, lates_only=False, year=None, month=None))
+# the analyze_last_month stats for one group's totals
+# months > 1 turns the counts and qty total into monthly averages
+def window_stats(totals, months=1):
+    wo_count, qty, late_count, late_qty, late_duration = totals.tolist()
 
-            late_qty_stats = analyze_qty(filter_data(period_data, converting_type=converting_type if converting_type != "total" else None, lates_only=True, year=None, month=None))
+    stats = {
+        "WO Count": wo_count,
+        "Total Qty": qty,
+        "Avg Qty": round(qty/wo_count,0) if wo_count else 0,
+        "Late WO Count": late_count,
+        "Late Avg Qty": round(late_qty/late_count,0) if late_count else 0,
+        "Late Avg Duration": round(late_duration/late_count,0) if late_count else 0,
+    }
 
-            late_duration_stats = analyze_late_duration(filter_data(period_data, converting_type=converting_type if converting_type != "total" else None, lates_only=True, year=None, month=None))
-            
-            stats[converting_type][period] = {
-                "WO Count": qty_stats["wo_count"] if qty_stats else 0,
-                "Total Qty": qty_stats["sum"] if qty_stats else 0,
-                "Avg Qty": qty_stats["avg"] if qty_stats else 0,
-                "Late WO Count": late_qty_stats["wo_count"] if late_qty_stats else 0,
-                "Late Avg Qty": late_qty_stats["avg"] if late_qty_stats else 0,
-                "Late Avg Duration": late_duration_stats["avg"] if late_duration_stats else 0,
-            }
+    if months > 1:
+        stats["WO Count"] = round(wo_count / months) if wo_count else 0
+        stats["Total Qty"] = round(qty / months) if wo_count else 0
+        stats["Late WO Count"] = round(late_count / months) if late_count else 0
 
-            if period == f"Rolling_{rolling_duration}mo":
-                stats[converting_type][period]["WO Count"] = round(qty_stats["wo_count"] / rolling_duration) if qty_stats else 0
+    return stats
 
-                stats[converting_type][period]["Total Qty"] = round(qty_stats["sum"] / rolling_duration) if qty_stats else 0
+# stats for one month compared against the rolling_duration months ending with it
+def compare_month(cube, year, month, rolling_duration, groups=CUBE_GROUPS):
+    stats = {}
+    idx = month_index(year, month)
+    period = f"{calendar.month_name[month]} {year}"
+    rolling_period = f"Rolling_{rolling_duration}mo"
 
-                stats[converting_type][period]["Late WO Count"] = round(late_qty_stats["wo_count"] / rolling_duration) if late_qty_stats else 0
+    month_totals = cube_window(cube, idx, idx)
+    rolling_totals = cube_window(cube, idx - rolling_duration + 1, idx)
 
+    for group, converting_type in enumerate(groups):
+        stats[converting_type] = {
+            period: window_stats(month_totals[group]),
+            rolling_period: window_stats(rolling_totals[group], rolling_duration),
+        }
         stats[converting_type]["%_change"] = {
-            "WO Count": calc_percent_change(stats[converting_type][f"{calendar.month_name[last_month.month]} {last_month.year}"]["WO Count"], stats[converting_type][f"Rolling_{rolling_duration}mo"]["WO Count"]),
-            "Total Qty": calc_percent_change(stats[converting_type][f"{calendar.month_name[last_month.month]} {last_month.year}"]["Total Qty"], stats[converting_type][f"Rolling_{rolling_duration}mo"]["Total Qty"]),
-            "Avg Qty": calc_percent_change(stats[converting_type][f"{calendar.month_name[last_month.month]} {last_month.year}"]["Avg Qty"], stats[converting_type][f"Rolling_{rolling_duration}mo"]["Avg Qty"]),
-            "Late WO Count": calc_percent_change(stats[converting_type][f"{calendar.month_name[last_month.month]} {last_month.year}"]["Late WO Count"], stats[converting_type][f"Rolling_{rolling_duration}mo"]["Late WO Count"]),
-            "Late Avg Qty": calc_percent_change(stats[converting_type][f"{calendar.month_name[last_month.month]} {last_month.year}"]["Late Avg Qty"], stats[converting_type][f"Rolling_{rolling_duration}mo"]["Late Avg Qty"]),
-            "Late Avg Duration": calc_percent_change(stats[converting_type][f"{calendar.month_name[last_month.month]} {last_month.year}"]["Late Avg Duration"], stats[converting_type][f"Rolling_{rolling_duration}mo"]["Late Avg Duration"]),
+            stat: calc_percent_change(stats[converting_type][period][stat], stats[converting_type][rolling_period][stat])
+            for stat in stats[converting_type][period]
         }
 
     return stats
 
+# get the stats just for the previous month and compare against the rolling average # of months
+# cube is build_monthly_cube(data), built here when it isn't passed in
+def analyze_last_month(data, rolling_duration, cube=None):
+    if cube == None:
+        cube = build_monthly_cube(data)
+    last_month = add_months(datetime.datetime.today(),-1) 
+    return compare_month(cube, last_month.year, last_month.month, rolling_duration)
+
+# the last month comparison for every month in the data set, keyed by "Month Year"
+def analyze_all_months(data, rolling_duration, cube=None):
+    if cube == None:
+        cube = build_monthly_cube(data)
+    stats = {}
+    if not data["raw"]:
+        return stats
+
+    date = add_months(data["first_date_seen"], 0)
+    while date <= data["last_date_seen"]:
+        stats[f"{calendar.month_name[date.month]} {date.year}"] = compare_month(cube, date.year, date.month, rolling_duration)
+        date = add_months(date, 1)
+
+    return stats
+
 def calc_percent_change(a, b):
     if b == 0:
         return None
     return round((a - b) / b, 3)
 
-def summarize_late_components(data):
+# count the components of late WOs per (year, month) in one pass over the data
+# counts are keyed by component id and keep first-seen order within each month
+def count_late_components(data):
+    counts = {}
+    for wo in data["raw"]:
+        if not wo["is_late"]:
+            continue
+
+        key = (wo["post_date"].year, wo["post_date"].month)
+        if key not in counts:
+            counts[key] = {}
+        seen_components = counts[key]
+
+        for component in wo["components"] or ():
+            idx = component_id(component)
+            if idx in seen_components:
+                seen_components[idx] += 1
+            else:
+                seen_components[idx] = 1
+
+    return counts
+
+# the top_k most common components as {name: count}, or all of them when top_k is None
+# ties keep first-seen order, the same as a stable sort would
+def top_components(counts, top_k=None):
+    if top_k == None:
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    else:
+        ranked = heapq.nlargest(top_k, counts.items(), key=lambda item: item[1])
+    return {COMPONENT_NAMES[idx]: count for idx, count in ranked}
+
+def summarize_late_components(data, top_k=None):
+    return summarize_component_counts(count_late_components(data), data, top_k)
+
+# build the components summary from count_late_components style counts
+# data only needs "years_seen", "first_date_seen" and "last_date_seen"
+def summarize_component_counts(counts, data, top_k=None):
     stats = {}
-    raw_data = data["raw"]
 
     for year in data["years_seen"]:
         stats[year] = {}
@@ -231,23 +1153,18 @@ def summarize_late_components(data):
                 continue
 
             month = calendar.month_name[num]
-            filtered_data = filter_data(raw_data, converting_type=None, lates_only=True, year=year, month=num)
-
-            seen_components_monthly = {}
-            for wo in filtered_data:
-                for component in wo["components"]:
-                    if component in seen_components_monthly:
-                        seen_components_monthly[component] += 1
-                    else:
-                        seen_components_monthly[component] = 1
-                    if component in seen_components_yearly:
-                        seen_components_yearly[component] += 1
-                    else:
-                        seen_components_yearly[component] = 1
-
-            stats[year]["months"][month] = dict(sorted(seen_components_monthly.items(), key=lambda item: item[1], reverse=True))
+            seen_components_monthly = counts.get((year, num), {})
+
+            # merging months in order gives the same first-seen order as counting the year's WOs
+            for idx, count in seen_components_monthly.items():
+                if idx in seen_components_yearly:
+                    seen_components_yearly[idx] += count
+                else:
+                    seen_components_yearly[idx] = count
+
+            stats[year]["months"][month] = top_components(seen_components_monthly, top_k)
         
-        stats[year]["components"] = dict(sorted(seen_components_yearly.items(), key=lambda item: item[1], reverse=True))
+        stats[year]["components"] = top_components(seen_components_yearly, top_k)
 
     return stats
 
@@ -275,29 +1192,341 @@ def within_date_range(year, month, start, end):
         return False
     return True
 
+# stats for one slice of the buckets
+def summarize_period(buckets, converting_type=None, year=None, month=None):
+    period_data = filter_buckets(buckets, converting_type, False, year, month)
+    late_data = filter_buckets(buckets, converting_type, True, year, month)
+
+    return {
+        "wo_count": len(period_data),
+        "qtys": analyze_qty(period_data),
+        "late_count": len(late_data),
+        "late_qtys": analyze_qty(late_data),
+        "late_durations": analyze_late_duration(late_data),
+    }
+
+# a mergeable t-digest of qtys or late durations
+# up to exact_size values are kept as they are, so small buckets give exact quantiles
+# (picked by selection, at the same position analyze_values takes the median from);
+# past that they're compressed into at most ~compression weighted centroids
+class QuantileSketch:
+    __slots__ = ("compression", "exact_size", "values", "means", "weights", "count", "min", "max")
+
+    def __init__(self, compression=SKETCH_COMPRESSION, exact_size=SKETCH_EXACT_SIZE):
+        self.compression = compression
+        self.exact_size = exact_size
+        self.values = []
+        self.means = None
+        self.weights = None
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    @property
+    def is_exact(self):
+        return self.means is None
+
+    def add(self, value):
+        self.count += 1
+        self.min = value if self.min == None or value < self.min else self.min
+        self.max = value if self.max == None or value > self.max else self.max
+        self.values.append(value)
+        if self.is_exact:
+            if len(self.values) > self.exact_size:
+                self.compress()
+        elif len(self.values) >= self.compression * 5:
+            self.compress()
+
+    # fold another sketch into this one, without needing the values either was built from
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.min = other.min if self.min == None or other.min < self.min else self.min
+        self.max = other.max if self.max == None or other.max > self.max else self.max
+        self.values.extend(other.values)
+
+        if not other.is_exact:
+            if self.is_exact:
+                self.means, self.weights = other.means.copy(), other.weights.copy()
+            else:
+                self.means = np.concatenate([self.means, other.means])
+                self.weights = np.concatenate([self.weights, other.weights])
+            self.compress()
+        elif self.is_exact and len(self.values) <= self.exact_size:
+            return self
+        else:
+            self.compress()
+        return self
+
+    # merge the buffered values and centroids, keeping each centroid within the size the
+    # k1 scale function allows, which is small near the tails and large around the median
+    def compress(self):
+        means = np.asarray(self.values, dtype=np.float64)
+        weights = np.ones(len(means))
+        if not self.is_exact:
+            means = np.concatenate([self.means, means])
+            weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order].tolist(), weights[order].tolist()
+
+        total = sum(weights)
+        new_means, new_weights = [], []
+        mean, weight = means[0], weights[0]
+        q0 = 0
+        limit = self.q_limit(q0)
+        for next_mean, next_weight in zip(means[1:], weights[1:]):
+            if (q0 + weight + next_weight) / total <= limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+                continue
+            new_means.append(mean)
+            new_weights.append(weight)
+            q0 += weight
+            limit = self.q_limit(q0 / total)
+            mean, weight = next_mean, next_weight
+        new_means.append(mean)
+        new_weights.append(weight)
+
+        self.means = np.array(new_means)
+        self.weights = np.array(new_weights)
+        self.values = []
+
+    # the highest quantile a centroid starting at quantile q may reach
+    def q_limit(self, q):
+        k = self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0), 1) - 1) + 1
+        if k >= self.compression / 4:
+            return 1
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs):
+        if self.count == 0:
+            return [None for _ in qs]
+
+        if self.is_exact:
+            positions = sorted(set(min(int(self.count * q), self.count - 1) for q in qs))
+            selected = np.partition(np.asarray(self.values), positions)
+            return [selected[min(int(self.count * q), self.count - 1)].item() for q in qs]
+
+        if self.values:
+            self.compress()
+
+        # each centroid's mean sits at the middle of its weight; interpolate between those
+        # points, and between the min/max and the outer centroids at the ends
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0], centers, [self.count]])
+        means = np.concatenate([[self.min], self.means, [self.max]])
+        return [float(np.interp(q * self.count, positions, means)) for q in qs]
+
+# per (year, month, type, is_late) sketches of qty and late duration, like group_data's buckets
+# exact=True keeps every value, so all the quantiles are exact
+def build_sketches(data, exact=False):
+    exact_size = math.inf if exact else SKETCH_EXACT_SIZE
+    sketches = {}
+    for wo in data["raw"]:
+        key = (wo["post_date"].year, wo["post_date"].month, wo["type"], wo["is_late"])
+        if key not in sketches:
+            sketches[key] = {"qty": QuantileSketch(exact_size=exact_size), "late_duration": QuantileSketch(exact_size=exact_size)}
+        sketches[key]["qty"].add(wo["qty"])
+        if wo["is_late"]:
+            sketches[key]["late_duration"].add(wo["late_duration"])
+
+    return sketches
+
+# one sketch of a measure over every bucket matching the filters, like filter_buckets
+# start/end are inclusive (year, month) tuples for rolling windows
+def merge_sketches(sketches, measure, converting_type=None, lates_only=False, year=None, month=None, start=None, end=None):
+    merged = None
+    for (wo_year, wo_month, wo_type, is_late), bucket in sketches.items():
+        if year != None and wo_year != year:
+            continue
+        if month != None and wo_month != month:
+            continue
+        if start != None and (wo_year, wo_month) < start:
+            continue
+        if end != None and (wo_year, wo_month) > end:
+            continue
+        if lates_only and is_late != True:
+            continue
+        if converting_type != None and contains(converting_type, wo_type) != True:
+            continue
+
+        if merged == None:
+            merged = QuantileSketch(bucket[measure].compression, bucket[measure].exact_size)
+        merged.merge(bucket[measure])
+
+    return merged
+
+# count and quantiles of a sketch, None when it's empty like analyze_values
+def analyze_sketch(sketch):
+    if sketch == None or sketch.count == 0:
+        return
+
+    stats = {"wo_count": sketch.count, "exact": sketch.is_exact, "min": sketch.min, "max": sketch.max}
+    for q, value in zip(QUANTILES, sketch.quantiles(QUANTILES)):
+        stats[f"p{round(q * 100)}"] = value if isinstance(value, int) else round(value, 2)
+    return stats
+
+def distribution_period(sketches, converting_type=None, year=None, month=None, start=None, end=None):
+    return {
+        "qtys": analyze_sketch(merge_sketches(sketches, "qty", converting_type, False, year, month, start, end)),
+        "late_qtys": analyze_sketch(merge_sketches(sketches, "qty", converting_type, True, year, month, start, end)),
+        "late_durations": analyze_sketch(merge_sketches(sketches, "late_duration", converting_type, True, year, month, start, end)),
+    }
+
+# summarize's layout with p50/p75/p90/p99 for qty, late qty and late duration
+# yearly quantiles come from merging the month sketches rather than re-reading WOs
+def summarize_distributions(data, sketches=None):
+    if sketches == None:
+        sketches = build_sketches(data)
+    return summarize_periods(data, lambda converting_type, year, month: distribution_period(sketches, converting_type, year, month))
+
+# quantiles for one month and the rolling_duration months ending with it, like compare_month
+def compare_month_distributions(sketches, year, month, rolling_duration):
+    start = add_months(datetime.datetime(year, month, 1), -(rolling_duration - 1))
+    stats = {}
+    for converting_type in CUBE_GROUPS:
+        group = converting_type if converting_type != "total" else None
+        stats[converting_type] = {
+            f"{calendar.month_name[month]} {year}": distribution_period(sketches, group, year, month),
+            f"Rolling_{rolling_duration}mo": distribution_period(sketches, group, start=(start.year, start.month), end=(year, month)),
+        }
+    return stats
+
+ROLLUP_DIMENSIONS = ["month", "type", "part_num", "component", "is_late"]
+ROLLUP_MEASURES = ["wo_count", "qty", "late_duration"]
+
+# totals of count, qty and late_duration for every (month, type, part_num, component,
+# is_late) combination seen, built in one pass and stored as numpy columns
+# each WO is added once with component -1, for queries that don't involve components,
+# and once per distinct component it uses, for queries by component
+# month is month_index(year, month) and names holds the strings behind the codes
+def build_rollup(data):
+    names = {"type": {}, "part_num": {}, "component": {}}
+    cells = {}
+
+    for wo in data["raw"]:
+        post_date = wo["post_date"]
+        month = month_index(post_date.year, post_date.month)
+        wo_type = names["type"].setdefault(wo["type"], len(names["type"]))
+        part_num = names["part_num"].setdefault(wo["part_num"], len(names["part_num"]))
+        is_late = bool(wo["is_late"])
+
+        keys = [(month, wo_type, part_num, -1, is_late)]
+        for component in dict.fromkeys(wo["components"] or ()):
+            keys.append((month, wo_type, part_num, names["component"].setdefault(component, len(names["component"])), is_late))
+
+        for key in keys:
+            totals = cells.get(key)
+            if totals == None:
+                cells[key] = [1, wo["qty"], wo["late_duration"]]
+            else:
+                totals[0] += 1
+                totals[1] += wo["qty"]
+                totals[2] += wo["late_duration"]
+
+    keys = list(cells)
+    totals = list(cells.values())
+    return {
+        "names": {dimension: list(codes) for dimension, codes in names.items()},
+        "month": np.array([key[0] for key in keys], dtype=np.int32),
+        "type": np.array([key[1] for key in keys], dtype=np.int32),
+        "part_num": np.array([key[2] for key in keys], dtype=np.int32),
+        "component": np.array([key[3] for key in keys], dtype=np.int32),
+        "is_late": np.array([key[4] for key in keys], dtype=bool),
+        "wo_count": np.array([total[0] for total in totals], dtype=np.int64),
+        "qty": np.array([total[1] for total in totals]) if totals else np.array([], dtype=np.int64),
+        "late_duration": np.array([total[2] for total in totals], dtype=np.int64),
+    }
+
+# slice the rollup with the given filters and total it by the dimensions in `by`
+# returns {(value for each dimension in by): {"wo_count", "qty", "late_duration"}}, where
+# month values are (year, month) and the rest are the original names
+# any component filter or grouping counts a WO once per component it uses
+def rollup_query(rollup, by=(), year=None, month=None, converting_type=None, part_num=None, component=None, lates_only=False, start=None, end=None):
+    for dimension in by:
+        if dimension not in ROLLUP_DIMENSIONS:
+            raise ValueError(f"Unknown rollup dimension: {dimension}")
+
+    if component != None or "component" in by:
+        mask = rollup["component"] >= 0
+    else:
+        mask = rollup["component"] == -1
+
+    if year != None:
+        mask &= rollup["month"] // 12 == year
+    if month != None:
+        mask &= rollup["month"] % 12 + 1 == month
+    # start/end are inclusive (year, month) tuples
+    if start != None:
+        mask &= rollup["month"] >= month_index(*start)
+    if end != None:
+        mask &= rollup["month"] <= month_index(*end)
+    if lates_only:
+        mask &= rollup["is_late"]
+    if converting_type != None:
+        codes = [code for code, name in enumerate(rollup["names"]["type"]) if contains(converting_type, name) == True]
+        mask &= np.isin(rollup["type"], codes)
+    if part_num != None:
+        mask &= rollup["part_num"] == (rollup["names"]["part_num"].index(part_num) if part_num in rollup["names"]["part_num"] else -2)
+    if component != None:
+        mask &= rollup["component"] == (rollup["names"]["component"].index(component) if component in rollup["names"]["component"] else -2)
+
+    if not by:
+        groups = np.zeros(int(mask.sum()), dtype=np.int64)
+        group_keys = [()] if mask.any() else []
+    else:
+        columns = np.stack([rollup[dimension][mask].astype(np.int64) for dimension in by], axis=1)
+        unique, groups = np.unique(columns, axis=0, return_inverse=True)
+        groups = groups.reshape(-1)
+        group_keys = [tuple(rollup_value(rollup, dimension, code) for dimension, code in zip(by, row)) for row in unique.tolist()]
+
+    stats = {}
+    for measure in ROLLUP_MEASURES:
+        totals = np.zeros(len(group_keys), dtype=rollup[measure].dtype)
+        np.add.at(totals, groups, rollup[measure][mask])
+        for key, total in zip(group_keys, totals.tolist()):
+            stats.setdefault(key, {})[measure] = total
+
+    return stats
+
+def rollup_value(rollup, dimension, code):
+    if dimension == "month":
+        return (code // 12, code % 12 + 1)
+    if dimension == "is_late":
+        return bool(code)
+    return rollup["names"][dimension][code]
+
+# save the rollup as a compressed numpy archive, the names stored as JSON
+def save_rollup(rollup, name):
+    columns = {key: value for key, value in rollup.items() if key != "names"}
+    np.savez_compressed(f'{name}.npz', names=np.array(json.dumps(rollup["names"], default=str)), **columns)
+
+def load_rollup(name):
+    with np.load(f'{name}.npz') as archive:
+        rollup = {key: archive[key] for key in archive.files if key != "names"}
+        rollup["names"] = json.loads(str(archive["names"]))
+    return rollup
+
 # summarize the stats for all workorders
 def summarize(data):
+    buckets = group_data(data["raw"])
+    return summarize_periods(data, lambda converting_type, year, month: summarize_period(buckets, converting_type, year, month))
+
+# lay out the summarize results, getting each slice from period_stats(converting_type, year, month)
+# data only needs "years_seen", "first_date_seen" and "last_date_seen"
+def summarize_periods(data, period_stats, groups=("slit", "convert")):
     stats = {}
-    raw_data = data["raw"]
 
     for year in data["years_seen"]:
-        stats[year] = {
-            "wo_count": len(filter_data(raw_data, None, False, year, None)),
-            "qtys": analyze_qty(filter_data(raw_data, None, False, year, None)),
-            "late_count": len(filter_data(raw_data, None, True, year, None)),
-            "late_qtys": analyze_qty(filter_data(raw_data, None, True, year, None)),
-            "late_durations": analyze_late_duration(filter_data(raw_data, None, True, year, None)),
-        }
+        stats[year] = period_stats(None, year, None)
 
-        for converting_type in ["slit", "convert"]:
-            stats[year][converting_type] = {
-                "wo_count": len(filter_data(raw_data, converting_type, False, year, None)),
-                "qtys": analyze_qty(filter_data(raw_data, converting_type, False, year, None)),
-                "late_count": len(filter_data(raw_data, converting_type, True, year, None)),
-                "late_qtys": analyze_qty(filter_data(raw_data, converting_type, True, year, None)),
-                "late_durations": analyze_late_duration(filter_data(raw_data, converting_type, True, year, None)),
-                "months": {},
-            }
+        for converting_type in groups:
+            stats[year][converting_type] = period_stats(converting_type, year, None)
+            stats[year][converting_type]["months"] = {}
 
             for num in range(1, 13):
                 # if the month and year are NOT within the date range then continue
@@ -308,26 +1537,367 @@ def summarize(data):
                 stats[year][converting_type]["months"][month] = {
                     "month": month,
                     "month_num": num,
-                    "wo_count": len(filter_data(raw_data, converting_type, False, year, num)),
-                    "qtys": analyze_qty(filter_data(raw_data, converting_type, False, year, num)),
-                    "late_count": len(filter_data(raw_data, converting_type, True, year, num)),
-                    "late_qtys": analyze_qty(filter_data(raw_data, converting_type, True, year, num)),
-                    "late_durations": analyze_late_duration(filter_data(raw_data, converting_type, True, year, num)),
+                    **period_stats(converting_type, year, num),
                 }
 
     return stats
 
-def print_to_json(data, name):
-    data_json = json.dumps(data, indent=4, default=str)
+# running aggregates for a stream of WOs, so no WO has to be kept after it's seen
+# qtys and late durations are kept per (year, month, type, is_late) bucket as packed
+# arrays, which is all the exact medians need
+def new_aggregates():
+    return {
+        "qtys": {},
+        "late_durations": {},
+        "components": {},
+        "years_seen": [],
+        "first_date_seen": None,
+        "last_date_seen": None,
+    }
+
+# append to a packed array, switching it to floats if the export has fractional values
+def append_value(values, value):
+    try:
+        values.append(value)
+    except TypeError:
+        values = array('d', values)
+        values.append(value)
+    return values
+
+def aggregate_wo(aggregates, wo):
+    post_date = wo["post_date"]
+    year = post_date.year
+    if year not in aggregates["years_seen"]:
+        aggregates["years_seen"].append(year)
+    if aggregates["first_date_seen"] == None or post_date < aggregates["first_date_seen"]:
+        aggregates["first_date_seen"] = post_date
+    if aggregates["last_date_seen"] == None or post_date > aggregates["last_date_seen"]:
+        aggregates["last_date_seen"] = post_date
+
+    key = (year, post_date.month, wo["type"], wo["is_late"])
+    aggregates["qtys"][key] = append_value(aggregates["qtys"].get(key, array('q')), wo["qty"])
+
+    if not wo["is_late"]:
+        return
+
+    aggregates["late_durations"][key] = append_value(aggregates["late_durations"].get(key, array('q')), wo["late_duration"])
+
+    seen_components = aggregates["components"].setdefault((year, post_date.month), {})
+    for component in wo["components"] or ():
+        idx = component_id(component)
+        if idx in seen_components:
+            seen_components[idx] += 1
+        else:
+            seen_components[idx] = 1
+
+# summarize_period for the packed value buckets of new_aggregates
+def summarize_value_period(aggregates, converting_type=None, year=None, month=None):
+    qtys = filter_buckets(aggregates["qtys"], converting_type, False, year, month)
+    late_qtys = filter_buckets(aggregates["qtys"], converting_type, True, year, month)
+
+    return {
+        "wo_count": len(qtys),
+        "qtys": analyze_values(qtys),
+        "late_count": len(late_qtys),
+        "late_qtys": analyze_values(late_qtys),
+        "late_durations": analyze_values(filter_buckets(aggregates["late_durations"], converting_type, True, year, month)),
+    }
+
+# build_monthly_cube's month totals from the value buckets
+def aggregate_monthly(aggregates):
+    monthly = {}
+    for (year, month, wo_type, is_late), qtys in aggregates["qtys"].items():
+        idx = month_index(year, month)
+        if idx not in monthly:
+            monthly[idx] = [[0] * len(CUBE_MEASURES) for _ in CUBE_GROUPS]
+
+        for group, converting_type in enumerate(CUBE_GROUPS):
+            if converting_type != "total" and contains(converting_type, wo_type) != True:
+                continue
+            totals = monthly[idx][group]
+            totals[0] += len(qtys)
+            totals[1] += sum(qtys)
+            if is_late:
+                totals[2] += len(qtys)
+                totals[3] += sum(qtys)
+                totals[4] += sum(aggregates["late_durations"][(year, month, wo_type, is_late)])
+
+    return monthly
+
+# summarize, summarize_late_components and analyze_last_month in one pass over a WO stream
+# memory grows with the number of buckets and packed values, never with whole WOs
+def stream_summaries(wos, rolling_duration=3):
+    aggregates = new_aggregates()
+    for wo in wos:
+        aggregate_wo(aggregates, wo)
+
+    if aggregates["first_date_seen"] == None:
+        return {}, {}, {}
+
+    last_month = add_months(datetime.datetime.today(), -1)
+    results = summarize_periods(aggregates, lambda converting_type, year, month: summarize_value_period(aggregates, converting_type, year, month))
+    components = summarize_component_counts(aggregates["components"], aggregates)
+    last_month_results = compare_month(cube_from_monthly(aggregate_monthly(aggregates)), last_month.year, last_month.month, rolling_duration)
+
+    return results, components, last_month_results
+
+# the accepted WOs of an export one at a time, from xlsx or CSV/TSV
+def stream_export(wb_name):
+    return stream_values(export_rows(wb_name))
+
+# the unparsed rows (columns A-J) of an export, from xlsx or CSV/TSV
+def export_rows(wb_name):
+    if is_delimited(wb_name):
+        yield from read_delimited(wb_name)
+        return
+
+    wb = open_wb(wb_name, read_only=True)
+    try:
+        yield from wb.active.iter_rows(min_row=1, max_col=10, values_only=True)
+    finally:
+        wb.close()
+
+# a uniform reservoir sample of an export's accepted rows from one pass over it
+# only the sampled rows are parsed; every accepted row just has its post date read
+# so the row count, years and date range are exact
+def sample_export(wb_name, sample_size=PREVIEW_SAMPLE_SIZE, seed=None):
+    rng = random.Random(seed)
+    sample = []
+    # text exports repeat the same few thousand dates, so parse each one once
+    dates = {}
+    preview = {"population": 0, "years_seen": [], "first_date_seen": None, "last_date_seen": None}
+
+    for row in export_rows(wb_name):
+        if not is_accepted(row):
+            continue
+
+        post_date = row[5]
+        if isinstance(post_date, str):
+            if post_date not in dates:
+                dates[post_date] = parse_date(post_date)
+            post_date = dates[post_date]
+        if post_date.year not in preview["years_seen"]:
+            preview["years_seen"].append(post_date.year)
+        if preview["first_date_seen"] == None or post_date < preview["first_date_seen"]:
+            preview["first_date_seen"] = post_date
+        if preview["last_date_seen"] == None or post_date > preview["last_date_seen"]:
+            preview["last_date_seen"] = post_date
+
+        seen = preview["population"]
+        preview["population"] += 1
+        if seen < sample_size:
+            sample.append(row)
+        else:
+            slot = rng.randrange(seen + 1)
+            if slot < sample_size:
+                sample[slot] = row
+
+    preview["raw"] = [parse_row(row) for row in sample]
+    preview["table"] = build_table(preview["raw"])
+    return preview
+
+# population total of a per-row value (0 outside the slice) estimated from the sample,
+# returned as (estimate, low, high); the low end never drops below what the sample
+# itself already adds up to when the values can't be negative
+def estimate_total(values, population):
+    sample_size = len(values)
+    values = values.astype(np.float64)
+    mean = values.mean()
+    error = 0
+    if sample_size > 1:
+        error = PREVIEW_Z * values.std(ddof=1) / math.sqrt(sample_size) * math.sqrt(max(1 - sample_size / population, 0))
+
+    low = population * (mean - error)
+    if values.min() >= 0:
+        low = max(low, values.sum())
+    return population * mean, low, population * (mean + error)
+
+# analyze_values style estimates for the sampled values of one slice
+# the median interval is the pair of order statistics around it
+def estimate_values(preview, column, mask):
+    if not mask.any():
+        return
+
+    values = np.sort(column[mask])
+    count = len(values)
+    wo_count, wo_count_low, wo_count_high = estimate_total(mask, preview["population"])
+    total, total_low, total_high = estimate_total(np.where(mask, column, 0), preview["population"])
+    avg = values.mean().item()
+    avg_error = PREVIEW_Z * values.std(ddof=1).item() / math.sqrt(count) if count > 1 else 0
+    rank_error = PREVIEW_Z * math.sqrt(count) / 2
+
+    return {
+        "wo_count": round(wo_count),
+        "wo_count_ci": [round(wo_count_low), round(wo_count_high)],
+        "sum": round(total),
+        "sum_ci": [round(total_low), round(total_high)],
+        "avg": round(avg, 0),
+        "avg_ci": [round(avg - avg_error, 0), round(avg + avg_error, 0)],
+        "median": values[int(count/2)].item(),
+        "median_ci": [values[max(math.floor(count/2 - rank_error), 0)].item(), values[min(math.ceil(count/2 + rank_error), count - 1)].item()],
+        "sample_count": count,
+    }
+
+# summarize_period estimated from a preview sample, with the late ratio of the slice
+def preview_period(preview, converting_type=None, year=None, month=None):
+    table = preview["table"]
+    mask = table_mask(table, converting_type, False, year, month)
+    late_mask = table_mask(table, converting_type, True, year, month)
+    qtys = estimate_values(preview, table["qty"], mask)
+    late_qtys = estimate_values(preview, table["qty"], late_mask)
+
+    stats = {
+        "wo_count": qtys["wo_count"] if qtys else 0,
+        "qtys": qtys,
+        "late_count": late_qtys["wo_count"] if late_qtys else 0,
+        "late_qtys": late_qtys,
+        "late_durations": estimate_values(preview, table["late_duration"], late_mask),
+        "late_ratio": None,
+        "late_ratio_ci": None,
+    }
+
+    count = int(mask.sum())
+    if count:
+        ratio = int(late_mask.sum()) / count
+        error = PREVIEW_Z * math.sqrt(ratio * (1 - ratio) / count)
+        stats["late_ratio"] = round(ratio, 3)
+        stats["late_ratio_ci"] = [round(max(ratio - error, 0), 3), round(min(ratio + error, 1), 3)]
+
+    return stats
+
+def preview_summarize(preview):
+    return summarize_periods(preview, lambda converting_type, year, month: preview_period(preview, converting_type, year, month))
+
+# compare_month from the sample's month totals scaled up to the export, with the
+# intervals of the count and qty stats under "confidence"
+def preview_compare_month(preview, year, month, rolling_duration):
+    table = preview["table"]
+    scale = preview["population"] / max(table_size(table), 1)
+    monthly = {
+        idx: [[round(value * scale) for value in totals] for totals in groups]
+        for idx, groups in monthly_totals(preview["raw"]).items()
+    }
+    stats = compare_month(cube_from_monthly(monthly), year, month, rolling_duration)
+
+    months = table["year"].astype(np.int64) * 12 + table["month"] - 1
+    idx = month_index(year, month)
+    windows = {
+        f"{calendar.month_name[month]} {year}": (idx, 1),
+        f"Rolling_{rolling_duration}mo": (idx - rolling_duration + 1, rolling_duration),
+    }
+    for converting_type in CUBE_GROUPS:
+        group = table_mask(table, converting_type if converting_type != "total" else None)
+        stats[converting_type]["confidence"] = {}
+        for period, (first, window) in windows.items():
+            mask = group & (months >= first) & (months <= idx)
+            intervals = {}
+            for stat, values in [("WO Count", mask), ("Total Qty", np.where(mask, table["qty"], 0)), ("Late WO Count", mask & table["is_late"])]:
+                _, low, high = estimate_total(values, preview["population"])
+                intervals[stat] = [round(low / window), round(high / window)]
+            stats[converting_type]["confidence"][period] = intervals
+
+    return stats
 
-    with open(f'{name}.json', 'w', encoding='utf-8') as f:
-        f.write(data_json)
+def preview_last_month(preview, rolling_duration):
+    last_month = add_months(datetime.datetime.today(), -1)
+    return preview_compare_month(preview, last_month.year, last_month.month, rolling_duration)
 
-def print_excel_results(wb, results):
+# compact writes without indentation or spaces, compress gzips to {name}.json.gz
+def print_to_json(data, name, compact=False, compress=False):
+    if not compact and not compress:
+        data_json = json.dumps(data, indent=4, default=json_default_str)
 
-    ws = create_worksheet(wb, "Results")
-    wb.remove(ws)
-    ws = create_worksheet(wb, "Results")
+        with open(f'{name}.json', 'w', encoding='utf-8') as f:
+            f.write(data_json)
+        return
+
+    opener = gzip.open if compress else open
+    path = f'{name}.json.gz' if compress else f'{name}.json'
+    with opener(path, 'wt', encoding='utf-8') as f:
+        json.dump(data, f, indent=None if compact else 4, separators=(',', ':') if compact else None, default=json_default)
+
+# dates as ISO strings so they can be read back with datetime.fromisoformat
+def json_default(value):
+    if isinstance(value, WorkOrder):
+        return value.to_dict()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+# the original print_to_json formatting, which writes dates with str()
+def json_default_str(value):
+    if isinstance(value, WorkOrder):
+        return value.to_dict()
+    return str(value)
+
+# write the dataset's WOs to {name}.ndjson one record per line, without building
+# the whole file in memory first
+def print_to_ndjson(data, name, compress=False):
+    opener = gzip.open if compress else open
+    path = f'{name}.ndjson.gz' if compress else f'{name}.ndjson'
+    with opener(path, 'wt', encoding='utf-8') as f:
+        for wo in data["raw"]:
+            f.write(json.dumps(wo, separators=(',', ':'), default=json_default))
+            f.write('\n')
+
+# turn a WO read back from JSON into the same types collect_data produces
+def restore_record(wo):
+    wo["post_date"] = datetime.datetime.fromisoformat(wo["post_date"])
+    wo["due_date"] = datetime.datetime.fromisoformat(wo["due_date"])
+    if wo["components"] != None:
+        wo["components"] = [intern_component(component) for component in wo["components"]]
+    return wo
+
+# read WOs back from a .ndjson / .ndjson.gz file one line at a time, or from the
+# "raw" list of a data.json / data.json.gz written by print_to_json
+def read_records(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        if '.ndjson' in path:
+            for line in f:
+                if line.strip():
+                    yield restore_record(json.loads(line))
+        else:
+            for wo in json.load(f)["raw"]:
+                yield restore_record(wo)
+
+# rebuild the dataset from a JSON/NDJSON dump instead of re-parsing the export
+def load_records(path):
+    return build_data(read_records(path))
+
+# replace the given years in an existing {name}.json summary, keeping the rest as is
+# years missing from stats are dropped from the file
+def update_json(stats, name, years):
+    try:
+        with open(f'{name}.json', encoding='utf-8') as f:
+            existing = json.load(f)
+    except FileNotFoundError:
+        existing = {}
+
+    for year in years:
+        existing.pop(str(year), None)
+    existing.update(json.loads(json.dumps(stats, default=str)))
+    print_to_json(dict(sorted(existing.items(), key=lambda item: int(item[0]))), name)
+
+# report sheets are kept as {(row, column): value} while they're filled in, since
+# the blocks are laid out by looking at rows already used, which write-only
+# worksheets can't do
+def create_report():
+    return {}
+
+def create_report_sheet(report, sheet_name):
+    report[sheet_name] = {}
+    return report[sheet_name]
+
+def set_cell(ws, row, column, value):
+    ws[(int(row), int(column))] = value
+
+def sheet_max_row(ws):
+    return max((row for row, _ in ws), default=0)
+
+def print_excel_results(report, results):
+
+    ws = create_report_sheet(report, "Results")
 
     # print out monthly summary
     CONVERTING_TYPES = [
@@ -362,43 +1932,43 @@ def print_excel_results(wb, results):
     ]
 
     for idx, heading in enumerate(HEADINGS):
-        ws.cell(row=idx+2, column=1).value = heading
+        set_cell(ws, idx+2, 1, heading)
 
     col_count = 1
     for year in results:
         for month in results[year]["slit"]["months"]:
-            ws.cell(row=1, column=col_count+1).value = f'{month}-{year}'
+            set_cell(ws, 1, col_count+1, f'{month}-{year}')
 
             skip_count = len(HEADINGS)/len(CONVERTING_TYPES)
             for idx, converting_type in enumerate(CONVERTING_TYPES):
                 prop = results[year][converting_type]["months"][month]
                 
-                ws.cell(row=idx*skip_count + 2, column=col_count+1).value = prop["qtys"]["wo_count"] if prop["qtys"] else 0
-                ws.cell(row=idx*skip_count + 3, column=col_count+1).value = prop["qtys"]["sum"] if prop["qtys"] else 0
-                ws.cell(row=idx*skip_count + 4, column=col_count+1).value = prop["qtys"]["avg"] if prop["qtys"] else 0
-                ws.cell(row=idx*skip_count + 5, column=col_count+1).value = prop["qtys"]["median"] if prop["qtys"] else 0
-
-                ws.cell(row=idx*skip_count + 6, column=col_count+1).value = prop["late_qtys"]["wo_count"] if prop["late_qtys"] else 0
-                ws.cell(row=idx*skip_count + 7, column=col_count+1).value = prop["late_qtys"]["sum"] if prop["late_qtys"] else 0
-                ws.cell(row=idx*skip_count + 8, column=col_count+1).value = prop["late_qtys"]["avg"] if prop["late_qtys"] else 0
-                ws.cell(row=idx*skip_count + 9, column=col_count+1).value = prop["late_qtys"]["median"] if prop["late_qtys"] else 0
+                set_cell(ws, idx*skip_count + 2, col_count+1, prop["qtys"]["wo_count"] if prop["qtys"] else 0)
+                set_cell(ws, idx*skip_count + 3, col_count+1, prop["qtys"]["sum"] if prop["qtys"] else 0)
+                set_cell(ws, idx*skip_count + 4, col_count+1, prop["qtys"]["avg"] if prop["qtys"] else 0)
+                set_cell(ws, idx*skip_count + 5, col_count+1, prop["qtys"]["median"] if prop["qtys"] else 0)
+
+                set_cell(ws, idx*skip_count + 6, col_count+1, prop["late_qtys"]["wo_count"] if prop["late_qtys"] else 0)
+                set_cell(ws, idx*skip_count + 7, col_count+1, prop["late_qtys"]["sum"] if prop["late_qtys"] else 0)
+                set_cell(ws, idx*skip_count + 8, col_count+1, prop["late_qtys"]["avg"] if prop["late_qtys"] else 0)
+                set_cell(ws, idx*skip_count + 9, col_count+1, prop["late_qtys"]["median"] if prop["late_qtys"] else 0)
                 
-                ws.cell(row=idx*skip_count + 10, column=col_count+1).value = prop["late_durations"]["avg"] if prop["late_durations"] else 0
-                ws.cell(row=idx*skip_count + 11, column=col_count+1).value = prop["late_durations"]["median"] if prop["late_durations"] else 0
+                set_cell(ws, idx*skip_count + 10, col_count+1, prop["late_durations"]["avg"] if prop["late_durations"] else 0)
+                set_cell(ws, idx*skip_count + 11, col_count+1, prop["late_durations"]["median"] if prop["late_durations"] else 0)
 
                 if prop["qtys"] and prop["late_qtys"]:
                     late_ratio = round((prop["late_qtys"]["wo_count"] / prop["qtys"]["wo_count"])*100)
-                    ws.cell(row=idx*skip_count + 12, column=col_count+1).value = late_ratio
+                    set_cell(ws, idx*skip_count + 12, col_count+1, late_ratio)
                 else:
-                    ws.cell(row=idx*skip_count + 12, column=col_count+1).value = 0
+                    set_cell(ws, idx*skip_count + 12, col_count+1, 0)
 
             col_count+=1
 
-    return wb
+    return report
 
-def print_excel_annual_summaries(wb, results):
-    ws = wb["Results"]
-    START_ROW = ws.max_row + 2
+def print_excel_annual_summaries(report, results):
+    ws = report["Results"]
+    START_ROW = sheet_max_row(ws) + 2
 
     HEADINGS = [
         "Slit WO Count",
@@ -467,166 +2037,442 @@ def print_excel_annual_summaries(wb, results):
 
     # print headings
     for idx, heading in enumerate(ANNUAL_HEADINGS):
-        ws.cell(row=START_ROW+idx+1, column=1).value = heading
+        set_cell(ws, START_ROW+idx+1, 1, heading)
 
     # print values
     col_count = 1
     for year in results:
         # year
-        ws.cell(row=START_ROW, column=col_count+1).value = year
+        set_cell(ws, START_ROW, col_count+1, year)
         # "WO Count",
-        ws.cell(row=START_ROW+1, column=col_count+1).value = results[year]["wo_count"]
+        set_cell(ws, START_ROW+1, col_count+1, results[year]["wo_count"])
         # "Total Qty,
-        ws.cell(row=START_ROW+2, column=col_count+1).value = results[year]["qtys"]["sum"]
+        set_cell(ws, START_ROW+2, col_count+1, results[year]["qtys"]["sum"])
         # "Avg Qty",
-        ws.cell(row=START_ROW+3, column=col_count+1).value = results[year]["qtys"]["avg"]
+        set_cell(ws, START_ROW+3, col_count+1, results[year]["qtys"]["avg"])
         # "Median Qty",
-        ws.cell(row=START_ROW+4, column=col_count+1).value = results[year]["qtys"]["median"]
+        set_cell(ws, START_ROW+4, col_count+1, results[year]["qtys"]["median"])
         
         if results[year]["late_qtys"]:
             # "Late WO Count",
-            ws.cell(row=START_ROW+5, column=col_count+1).value = results[year]["late_qtys"]["wo_count"]
+            set_cell(ws, START_ROW+5, col_count+1, results[year]["late_qtys"]["wo_count"])
             # "Late Qty",
-            ws.cell(row=START_ROW+6, column=col_count+1).value = results[year]["late_qtys"]["sum"]
+            set_cell(ws, START_ROW+6, col_count+1, results[year]["late_qtys"]["sum"])
             # "Late Avg Qty",
-            ws.cell(row=START_ROW+7, column=col_count+1).value = results[year]["late_qtys"]["avg"]
+            set_cell(ws, START_ROW+7, col_count+1, results[year]["late_qtys"]["avg"])
             # "Late Median Qty",
-            ws.cell(row=START_ROW+8, column=col_count+1).value = results[year]["late_qtys"]["median"]
+            set_cell(ws, START_ROW+8, col_count+1, results[year]["late_qtys"]["median"])
 
         if results[year]["late_durations"]:
             # "Late Avg Duration",
-            ws.cell(row=START_ROW+9, column=col_count+1).value = results[year]["late_durations"]["avg"]
+            set_cell(ws, START_ROW+9, col_count+1, results[year]["late_durations"]["avg"])
             # "Late Median Duration",
-            ws.cell(row=START_ROW+10, column=col_count+1).value = results[year]["late_durations"]["median"]
+            set_cell(ws, START_ROW+10, col_count+1, results[year]["late_durations"]["median"])
         
         # "Slit WO Count",
-        ws.cell(row=START_ROW+11, column=col_count+1).value = results[year]["slit"]["qtys"]["wo_count"]
+        set_cell(ws, START_ROW+11, col_count+1, results[year]["slit"]["qtys"]["wo_count"])
         # "Slit Qty",
-        ws.cell(row=START_ROW+12, column=col_count+1).value = results[year]["slit"]["qtys"]["sum"]
+        set_cell(ws, START_ROW+12, col_count+1, results[year]["slit"]["qtys"]["sum"])
         # "Slit Avg Qty",
-        ws.cell(row=START_ROW+13, column=col_count+1).value = results[year]["slit"]["qtys"]["avg"]
+        set_cell(ws, START_ROW+13, col_count+1, results[year]["slit"]["qtys"]["avg"])
         # "Slit Median Qty",
-        ws.cell(row=START_ROW+14, column=col_count+1).value = results[year]["slit"]["qtys"]["median"]
+        set_cell(ws, START_ROW+14, col_count+1, results[year]["slit"]["qtys"]["median"])
         
         if results[year]["slit"]["late_qtys"]:
             # "Late WO Count",
-            ws.cell(row=START_ROW+15, column=col_count+1).value = results[year]["slit"]["late_qtys"]["wo_count"]
+            set_cell(ws, START_ROW+15, col_count+1, results[year]["slit"]["late_qtys"]["wo_count"])
             # "Late Qty",
-            ws.cell(row=START_ROW+16, column=col_count+1).value = results[year]["slit"]["late_qtys"]["sum"]
+            set_cell(ws, START_ROW+16, col_count+1, results[year]["slit"]["late_qtys"]["sum"])
             # "Late Avg Qty",
-            ws.cell(row=START_ROW+17, column=col_count+1).value = results[year]["slit"]["late_qtys"]["avg"]
+            set_cell(ws, START_ROW+17, col_count+1, results[year]["slit"]["late_qtys"]["avg"])
             # "Late Median Qty",
-            ws.cell(row=START_ROW+18, column=col_count+1).value = results[year]["slit"]["late_qtys"]["median"]
+            set_cell(ws, START_ROW+18, col_count+1, results[year]["slit"]["late_qtys"]["median"])
 
         if results[year]["slit"]["late_durations"]:
             # "Late Avg Duration",
-            ws.cell(row=START_ROW+19, column=col_count+1).value = results[year]["slit"]["late_durations"]["avg"]
+            set_cell(ws, START_ROW+19, col_count+1, results[year]["slit"]["late_durations"]["avg"])
             # "Late Median Duration",
-            ws.cell(row=START_ROW+20, column=col_count+1).value = results[year]["slit"]["late_durations"]["median"]
+            set_cell(ws, START_ROW+20, col_count+1, results[year]["slit"]["late_durations"]["median"])
        
         if results[year]["convert"]["qtys"]:
             # "Convert WO Count",
-            ws.cell(row=START_ROW+21, column=col_count+1).value = results[year]["convert"]["qtys"]["wo_count"]
+            set_cell(ws, START_ROW+21, col_count+1, results[year]["convert"]["qtys"]["wo_count"])
             # "Convert Qty",
-            ws.cell(row=START_ROW+22, column=col_count+1).value = results[year]["convert"]["qtys"]["sum"]
+            set_cell(ws, START_ROW+22, col_count+1, results[year]["convert"]["qtys"]["sum"])
             # "Convert Avg Qty",
-            ws.cell(row=START_ROW+23, column=col_count+1).value = results[year]["convert"]["qtys"]["avg"]
+            set_cell(ws, START_ROW+23, col_count+1, results[year]["convert"]["qtys"]["avg"])
             # "Convert Median Qty",
-            ws.cell(row=START_ROW+24, column=col_count+1).value = results[year]["convert"]["qtys"]["median"]
+            set_cell(ws, START_ROW+24, col_count+1, results[year]["convert"]["qtys"]["median"])
 
         if results[year]["convert"]["late_qtys"]:
             # "Late WO Count",
-            ws.cell(row=START_ROW+25, column=col_count+1).value = results[year]["convert"]["late_qtys"]["wo_count"]
+            set_cell(ws, START_ROW+25, col_count+1, results[year]["convert"]["late_qtys"]["wo_count"])
             # "Late Qty",
-            ws.cell(row=START_ROW+26, column=col_count+1).value = results[year]["convert"]["late_qtys"]["sum"]
+            set_cell(ws, START_ROW+26, col_count+1, results[year]["convert"]["late_qtys"]["sum"])
             # "Late Avg Qty",
-            ws.cell(row=START_ROW+27, column=col_count+1).value = results[year]["convert"]["late_qtys"]["avg"]
+            set_cell(ws, START_ROW+27, col_count+1, results[year]["convert"]["late_qtys"]["avg"])
             # "Late Median Qty",
-            ws.cell(row=START_ROW+28, column=col_count+1).value = results[year]["convert"]["late_qtys"]["median"]
+            set_cell(ws, START_ROW+28, col_count+1, results[year]["convert"]["late_qtys"]["median"])
 
         if results[year]["convert"]["late_durations"]:
             # "Late Avg Duration",
-            ws.cell(row=START_ROW+29, column=col_count+1).value = results[year]["convert"]["late_durations"]["avg"]
+            set_cell(ws, START_ROW+29, col_count+1, results[year]["convert"]["late_durations"]["avg"])
             # "Late Median Duration",
-            ws.cell(row=START_ROW+30, column=col_count+1).value = results[year]["convert"]["late_durations"]["median"]
+            set_cell(ws, START_ROW+30, col_count+1, results[year]["convert"]["late_durations"]["median"])
         
         col_count += 1
 
-    return wb
+    return report
 
 # print the top 3 components with late work orders associated with them
-def print_excel_components(wb, components):
-    ws = wb["Results"]
-    START_ROW = ws.max_row + 2
+def print_excel_components(report, components):
+    ws = report["Results"]
+    START_ROW = sheet_max_row(ws) + 2
     col_count = 2
 
     # side headings
-    ws.cell(row=START_ROW+1, column=1).value = "Component 1"
-    ws.cell(row=START_ROW+2, column=1).value = "Component 1 Count"
-    ws.cell(row=START_ROW+3, column=1).value = "Component 2"
-    ws.cell(row=START_ROW+4, column=1).value = "Component 2 Count"
-    ws.cell(row=START_ROW+5, column=1).value = "Component 3"
-    ws.cell(row=START_ROW+6, column=1).value = "Component 3 Count"
+    set_cell(ws, START_ROW+1, 1, "Component 1")
+    set_cell(ws, START_ROW+2, 1, "Component 1 Count")
+    set_cell(ws, START_ROW+3, 1, "Component 2")
+    set_cell(ws, START_ROW+4, 1, "Component 2 Count")
+    set_cell(ws, START_ROW+5, 1, "Component 3")
+    set_cell(ws, START_ROW+6, 1, "Component 3 Count")
 
     for year in components:
         for month in components[year]["months"]:
             # print month-year
-            ws.cell(row=START_ROW, column=col_count).value = f'{month}-{year}'
+            set_cell(ws, START_ROW, col_count, f'{month}-{year}')
             
             # print top components
             component_stats = list(components[year]["months"][month].items())
             for idx, (name, count) in enumerate(component_stats):
                 if idx >= 3:
                     break
-                ws.cell(row=START_ROW+1+idx*2, column=col_count).value = name
-                ws.cell(row=START_ROW+2+idx*2, column=col_count).value = count
+                set_cell(ws, START_ROW+1+idx*2, col_count, name)
+                set_cell(ws, START_ROW+2+idx*2, col_count, count)
 
             col_count += 1
 
-    return wb
+    return report
 
-def print_excel_last_month(wb, last_month_results):
-    ws = wb["Results"]
-    START_ROW = ws.max_row + 2
+def print_excel_last_month(report, last_month_results):
+    ws = report["Results"]
+    START_ROW = sheet_max_row(ws) + 2
     col_count = 1
 
     # top headings
     for idx, period in enumerate(last_month_results["total"].keys()):
-        ws.cell(row=START_ROW, column=col_count+1+idx).value = period
+        set_cell(ws, START_ROW, col_count+1+idx, period)
 
     # stats
     for i, converting_type in enumerate(last_month_results.keys()):
         for j, period in enumerate(last_month_results[converting_type].keys()):
             for k, stat in enumerate(last_month_results[converting_type][period].keys()):
                 # side headings
-                ws.cell(row=START_ROW+1+(k+(i*6)), column=col_count).value = f'{converting_type} {stat}'
+                set_cell(ws, START_ROW+1+(k+(i*6)), col_count, f'{converting_type} {stat}')
 
                 # data summary
-                ws.cell(row=START_ROW+1+(k+(i*6)), column=col_count+j+1).value = last_month_results[converting_type][period][stat]
+                set_cell(ws, START_ROW+1+(k+(i*6)), col_count+j+1, last_month_results[converting_type][period][stat])
     
-    return wb
-
-def save_workbook(wb, name):
-    wb.save(f"U:\Josh\JD Working Folder\Adheco General\Warehouse\Converting Analysis/{name}_{datetime.datetime.today().strftime('%d%b%Y')}.xlsx")
+    return report
+
+# write a report to a new write-only workbook, streaming each sheet's rows in order
+# so saving costs only as much as the report, not the input export
+def save_report(report, path):
+    wb = openpyxl.Workbook(write_only=True)
+    for sheet_name, ws in report.items():
+        out = wb.create_sheet(sheet_name)
+        columns = max((column for _, column in ws), default=0)
+        for row in range(1, sheet_max_row(ws) + 1):
+            out.append([ws.get((row, column)) for column in range(1, columns + 1)])
+    wb.save(path)
+
+def save_workbook(report, name):
+    save_report(report, f"U:\Josh\JD Working Folder\Adheco General\Warehouse\Converting Analysis/{name}_{datetime.datetime.today().strftime('%d%b%Y')}.xlsx")
 
 def console_log_json(data):
     print(json.dumps(data, indent=2, default=str))
 
-def main(wb_name):
-    wb = open_wb(wb_name)
-    data = collect_data(wb)
-    results = summarize(data)
-    components = summarize_late_components(data)
-    last_month_results = analyze_last_month(data, 3)
-    print_to_json(data, "data")
+# compact writes the WOs as gzipped NDJSON and the summaries as compact JSON
+def write_json_outputs(data, results, components, last_month_results, rolling_history, compact=False):
+    if compact:
+        print_to_ndjson(data, "data", compress=True)
+    else:
+        print_to_json(data, "data")
+    print_to_json(results, "results", compact)
+    print_to_json(components, "components", compact)
+    print_to_json(last_month_results, "last_month", compact)
+    print_to_json(rolling_history, "rolling_history", compact)
+
+def build_report(results, components, last_month_results):
+    report = create_report()
+    print_excel_results(report, results)
+    print_excel_components(report, components)
+    print_excel_annual_summaries(report, results)
+    print_excel_last_month(report, last_month_results)
+    return report
+
+# everything the batch variants are answered from, built with one pass over the WOs:
+# the group_data buckets, each bucket's month totals and the late component counts
+def build_shared_aggregates(data):
+    buckets = group_data(data["raw"])
+    totals = {}
+    for key, wos in buckets.items():
+        qty = sum(wo["qty"] for wo in wos)
+        late_duration = sum(wo["late_duration"] for wo in wos) if key[3] else 0
+        totals[key] = (len(wos), qty, late_duration)
+
+    return {
+        "data": data,
+        "buckets": buckets,
+        "totals": totals,
+        "components": count_late_components(data),
+    }
+
+def parse_config_month(value):
+    if value == None:
+        return
+    year, month = str(value).split("-")
+    return (int(year), int(month))
+
+# fill in a batch variant's defaults and check its settings
+def read_variant(variant):
+    if "name" not in variant:
+        raise ValueError("Every batch variant needs a name")
+    unknown = set(variant) - {"name", "rolling_duration", "groups", "start", "end", "month", "top_k", "output", "workbook"}
+    if unknown:
+        raise ValueError(f'Unknown settings in variant {variant["name"]}: {", ".join(sorted(unknown))}')
+
+    output = variant.get("output", variant["name"])
+    groups = variant.get("groups", DEFAULT_GROUPS)
+    if "total" in groups:
+        raise ValueError(f'Variant {variant["name"]} can\'t have a group called "total"')
+    if variant.get("rolling_duration", 3) < 1:
+        raise ValueError(f'Variant {variant["name"]} needs a rolling_duration of at least 1')
+
+    # the Excel report's layout is built around the slit and convert groups
+    workbook = variant.get("workbook", os.path.join(output, "Workorder Analysis.xlsx"))
+    if set(groups) != set(DEFAULT_GROUPS):
+        if variant.get("workbook"):
+            print(f'Skipping the workbook for {variant["name"]}: the Excel report only lays out the slit and convert groups')
+        workbook = None
+
+    return {
+        "name": variant["name"],
+        "rolling_duration": variant.get("rolling_duration", 3),
+        "groups": groups,
+        "start": parse_config_month(variant.get("start")),
+        "end": parse_config_month(variant.get("end")),
+        "month": parse_config_month(variant.get("month")),
+        "top_k": variant.get("top_k"),
+        "output": output,
+        "workbook": workbook or None,
+    }
+
+# the shared aggregates limited to the variant's months, with the years and date range
+# of the WOs left in them (no years and no dates when the window holds no WOs)
+def variant_range(shared, variant):
+    keep = lambda year, month: (variant["start"] == None or (year, month) >= variant["start"]) and (variant["end"] == None or (year, month) <= variant["end"])
+    buckets = {key: wos for key, wos in shared["buckets"].items() if keep(key[0], key[1])}
+
+    years = set(key[0] for key in buckets)
+    post_dates = [wo["post_date"] for wos in buckets.values() for wo in wos]
+
+    return {
+        "years_seen": [year for year in shared["data"]["years_seen"] if year in years],
+        "first_date_seen": min(post_dates) if post_dates else None,
+        "last_date_seen": max(post_dates) if post_dates else None,
+        "buckets": buckets,
+        "totals": {key: totals for key, totals in shared["totals"].items() if keep(key[0], key[1])},
+        "components": {key: counts for key, counts in shared["components"].items() if keep(*key)},
+    }
+
+# the month totals of build_monthly_cube for a variant's groups, from the bucket totals
+def variant_monthly(totals, groups):
+    monthly = {}
+    for (year, month, wo_type, is_late), (wo_count, qty, late_duration) in totals.items():
+        idx = month_index(year, month)
+        if idx not in monthly:
+            monthly[idx] = [[0] * len(CUBE_MEASURES) for _ in range(len(groups) + 1)]
+
+        for group, patterns in enumerate([None] + list(groups.values())):
+            if patterns != None and not matches_type(patterns, wo_type):
+                continue
+            month_totals = monthly[idx][group]
+            month_totals[0] += wo_count
+            month_totals[1] += qty
+            if is_late:
+                month_totals[2] += wo_count
+                month_totals[3] += qty
+                month_totals[4] += late_duration
+
+    return monthly
+
+# results, components and last month for one batch variant
+def summarize_variant(shared, variant):
+    period = variant_range(shared, variant)
+    if not period["years_seen"]:
+        return {}, {}, {}
+
+    groups = variant["groups"]
+    results = summarize_periods(period, lambda group, year, month: summarize_period(period["buckets"], groups[group] if group != None else None, year, month), list(groups))
+    components = summarize_component_counts(period["components"], period, variant["top_k"])
+
+    compared = variant["month"]
+    if compared == None:
+        last_month = add_months(datetime.datetime.today(), -1)
+        compared = (last_month.year, last_month.month)
+    cube_groups = ["total"] + list(groups)
+    cube = cube_from_monthly(variant_monthly(period["totals"], groups), cube_groups)
+    last_month_results = compare_month(cube, *compared, variant["rolling_duration"], cube_groups)
+
+    return results, components, last_month_results
+
+# write one variant's outputs; runs in a worker process
+# a variant with no WOs in its window gets empty JSON and no workbook
+def write_variant(variant, results, components, last_month_results):
+    start = time.perf_counter()
+    os.makedirs(variant["output"], exist_ok=True)
+    print_to_json(results, os.path.join(variant["output"], "results"))
+    print_to_json(components, os.path.join(variant["output"], "components"))
+    print_to_json(last_month_results, os.path.join(variant["output"], "last_month"))
+    if variant["workbook"] and results:
+        workbook_dir = os.path.dirname(variant["workbook"])
+        if workbook_dir:
+            os.makedirs(workbook_dir, exist_ok=True)
+        save_report(build_report(results, components, last_month_results), variant["workbook"])
+    return variant["name"], round(time.perf_counter() - start, 3)
+
+# profile=True writes per-stage timings, memory peaks and counters to profile.json,
+# and cprofile=True also dumps a profile_<stage>.prof for each stage
+# compact_records keeps the WOs as WorkOrders to fit long histories in less memory
+def main(wb_name, compact=False, profile=False, cprofile=False, compact_records=False):
+    if profile:
+        start_profile(cprofile)
+
+    # profiling is stopped and profile.json written even when a stage fails
+    try:
+        data = load_data(wb_name, compact_records=compact_records)
+        results = run_stage("summarize", summarize, data)
+        components = run_stage("summarize_late_components", summarize_late_components, data)
+        cube = run_stage("build_monthly_cube", build_monthly_cube, data)
+        last_month_results = run_stage("analyze_last_month", analyze_last_month, data, 3, cube)
+        rolling_history = run_stage("analyze_all_months", analyze_all_months, data, 3, cube)
+        run_stage("json_output", write_json_outputs, data, results, components, last_month_results, rolling_history, compact)
+        report = run_stage("excel_report", build_report, results, components, last_month_results)
+        run_stage("save_workbook", save_workbook, report, "Workorder Analysis")
+    finally:
+        if profile:
+            finish_profile(wb_name)
+
+# summaries and report straight from the export rows, without holding the WOs in memory
+# data.json isn't written since the WOs are never collected
+def main_streaming(wb_name, rolling_duration=3):
+    results, components, last_month_results = stream_summaries(stream_export(wb_name), rolling_duration)
     print_to_json(results, "results")
     print_to_json(components, "components")
     print_to_json(last_month_results, "last_month")
-    print_excel_results(wb, results)
-    print_excel_components(wb, components)
-    print_excel_annual_summaries(wb, results)
-    print_excel_last_month(wb, last_month_results)
-    save_workbook(wb, "Workorder Analysis")
-
-main('~CRF096_December2024.xlsx')
+    save_workbook(build_report(results, components, last_month_results), "Workorder Analysis")
+
+# merge a new export into the WO store and only recompute the years it changed
+# annual totals and medians need every WO of their year, so a touched month
+# means re-summarizing its year from the store rather than the whole history
+def main_incremental(wb_name, rolling_duration=3):
+    store = load_store()
+    old_range = sorted(store["months"])
+    touched = merge_into_store(store, load_data(wb_name))
+
+    # months that only exist because the date range grew still need (empty) entries
+    new_range = sorted(store["months"])
+    if new_range:
+        date = datetime.datetime(*new_range[0], 1)
+        while (date.year, date.month) <= new_range[-1]:
+            if not old_range or (date.year, date.month) < old_range[0] or (date.year, date.month) > old_range[-1]:
+                touched.add((date.year, date.month))
+            date = add_months(date, 1)
+
+    years = sorted(set(year for year, _ in touched))
+    print(f'Recomputing {len(years)} year(s) from {len(touched)} changed month(s)')
+    if years:
+        year_data = store_data(store, years)
+        update_json(summarize(year_data), "results", years)
+        update_json(summarize_late_components(year_data), "components", years)
+
+    # the rolling comparison only needs the last few months
+    start = add_months(datetime.datetime.today(), -rolling_duration)
+    recent_data = store_data(store, range(start.year, datetime.datetime.today().year + 1))
+    print_to_json(analyze_last_month(recent_data, rolling_duration), "last_month")
+
+    save_store(store)
+
+# qty and late duration percentiles, written to distributions.json
+# exact=True skips the sketches' compression so every quantile is exact
+def main_distributions(wb_name, rolling_duration=3, exact=False):
+    data = load_data(wb_name)
+    sketches = build_sketches(data, exact)
+    last_month = add_months(datetime.datetime.today(), -1)
+    print_to_json({
+        "summary": summarize_distributions(data, sketches),
+        "last_month": compare_month_distributions(sketches, last_month.year, last_month.month, rolling_duration),
+    }, "distributions")
+
+# quick estimates of results.json and last_month.json from a sample of the export,
+# written to preview.json
+def main_preview(wb_name, rolling_duration=3, sample_size=PREVIEW_SAMPLE_SIZE, seed=None):
+    preview = sample_export(wb_name, sample_size, seed)
+    print(f'Sampled {table_size(preview["table"])} of {preview["population"]} WOs')
+    if not preview["raw"]:
+        return
+    print_to_json({
+        "population": preview["population"],
+        "sample_size": table_size(preview["table"]),
+        "results": preview_summarize(preview),
+        "last_month": preview_last_month(preview, rolling_duration),
+    }, "preview")
+
+# run every report variant in a JSON config off one parse of the export:
+# {"export": "...", "workers": 4, "variants": [{"name": "6mo", "rolling_duration": 6, ...}]}
+# see the README for the variant settings
+def main_batch(config_name):
+    with open(config_name, encoding='utf-8') as f:
+        config = json.load(f)
+    variants = [read_variant(variant) for variant in config.get("variants", [])]
+    names = [variant["name"] for variant in variants]
+    if len(set(names)) != len(names):
+        raise ValueError("Batch variant names must be unique")
+
+    shared = build_shared_aggregates(load_data(config["export"]))
+    failed = []
+    outputs = []
+    for variant in variants:
+        try:
+            outputs.append((variant, *summarize_variant(shared, variant)))
+        except Exception as e:
+            print(f'Failed to summarize {variant["name"]}: {e!r}')
+            failed.append(variant["name"])
+
+    # one variant failing to write doesn't stop the others
+    with ProcessPoolExecutor(max_workers=config.get("workers")) as pool:
+        futures = {pool.submit(write_variant, *output): output[0]["name"] for output in outputs}
+        for future in as_completed(futures):
+            try:
+                name, elapsed = future.result()
+                print(f'Wrote {name} in {elapsed}s')
+            except Exception as e:
+                print(f'Failed to write {futures[future]}: {e!r}')
+                failed.append(futures[future])
+
+    if failed:
+        print(f'{len(failed)} of {len(variants)} variants failed: {", ".join(failed)}')
+    return failed
+
+# what changed between two exports, written to diff.json
+def main_diff(old_name, new_name, name="diff"):
+    diff = diff_exports(load_data(old_name), load_data(new_name))
+    print(f'{len(diff["added"])} added, {len(diff["removed"])} removed, {len(diff["changed"])} changed ({len(diff["turned_late"])} turned late)')
+    print_to_json(diff, name)
+    return diff
+
+if __name__ == "__main__":
+    main('~CRF096_December2024.xlsx')
 
@@ -0,0 +1,297 @@
+import argparse
+import collections
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import compile
+
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_SIZE = 128
+
+# the loaded dataset plus an LRU cache of query results computed from it
+# loading another export replaces the dataset and empties the cache
+# the lock only guards the cache and the current state; queries are computed outside it,
+# and concurrent requests for the same uncached result wait for the first one to finish it
+class AnalyticsService:
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.state = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, wb_name):
+        # open_wb prints and returns None for a missing or unreadable workbook
+        wb = None
+        if not compile.is_delimited(wb_name):
+            wb = compile.open_wb(wb_name, read_only=True)
+            if wb == None:
+                raise ValueError(f"Couldn't open {wb_name} as a workbook")
+        try:
+            data = compile.load_data(wb_name, wb)
+        finally:
+            if wb != None:
+                wb.close()
+
+        state = {
+            "data": data,
+            "wb_name": wb_name,
+            "loaded_at": datetime.datetime.now(),
+            "shared": {},
+            "shared_pending": {},
+            "lock": threading.Lock(),
+        }
+        with self.lock:
+            self.state = state
+            self.cache.clear()
+            self.pending = {}
+        return self.status()
+
+    def status(self):
+        with self.lock:
+            state = self.state
+            stats = {
+                "cache_entries": len(self.cache),
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+            }
+        data = state["data"] if state else None
+        return {
+            "export": state["wb_name"] if state else None,
+            "loaded_at": state["loaded_at"] if state else None,
+            "wo_count": len(data["raw"]) if data else 0,
+            "first_date_seen": data["first_date_seen"] if data else None,
+            "last_date_seen": data["last_date_seen"] if data else None,
+            **stats,
+        }
+
+    # run a query through the cache, returning (result, cached)
+    def query(self, name, params):
+        key = (name, tuple(sorted(params.items())))
+        while True:
+            with self.lock:
+                state = self.state
+                if state == None:
+                    raise ValueError("No export loaded")
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    self.hits += 1
+                    return self.cache[key], True
+
+                event = self.pending.get(key)
+                if event == None:
+                    event = threading.Event()
+                    self.pending[key] = event
+                    self.misses += 1
+                    break
+            # someone else is computing it; use their result, or try again if they failed
+            event.wait()
+
+        try:
+            result = QUERIES[name](state, **params)
+            with self.lock:
+                # results from an export that has since been replaced aren't cached
+                if self.state is state:
+                    self.cache[key] = result
+                    if len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+            return result, False
+        finally:
+            with self.lock:
+                if self.pending.get(key) is event:
+                    del self.pending[key]
+            event.set()
+
+# structures several queries are answered from, built once per loaded export
+# a caller arriving while another builds it waits instead of building it again
+def shared_value(state, name, build):
+    while True:
+        with state["lock"]:
+            if name in state["shared"]:
+                return state["shared"][name]
+            event = state["shared_pending"].get(name)
+            if event == None:
+                event = threading.Event()
+                state["shared_pending"][name] = event
+                break
+        event.wait()
+
+    try:
+        value = build(state["data"])
+        with state["lock"]:
+            state["shared"][name] = value
+        return value
+    finally:
+        with state["lock"]:
+            del state["shared_pending"][name]
+        event.set()
+
+def query_summarize(state, year=None):
+    results = shared_value(state, "summarize", compile.summarize)
+    if year == None:
+        return results
+    if year not in results:
+        raise ValueError(f"No WOs in {year}")
+    return {year: results[year]}
+
+def query_components(state, top_k=None, year=None):
+    counts = shared_value(state, "late_components", compile.count_late_components)
+    results = compile.summarize_component_counts(counts, state["data"], top_k)
+    if year == None:
+        return results
+    if year not in results:
+        raise ValueError(f"No WOs in {year}")
+    return {year: results[year]}
+
+# defaults to the previous month, like analyze_last_month
+def query_last_month(state, rolling_duration=3, year=None, month=None):
+    if rolling_duration < 1:
+        raise ValueError("rolling_duration must be at least 1")
+    if month != None and not 1 <= month <= 12:
+        raise ValueError("month must be between 1 and 12")
+
+    last_month = compile.add_months(datetime.datetime.today(), -1)
+    year = last_month.year if year == None else year
+    month = last_month.month if month == None else month
+    cube = shared_value(state, "monthly_cube", compile.build_monthly_cube)
+    return compile.compare_month(cube, year, month, rolling_duration)
+
+# rollup_query totals as a list, since its tuple keys can't be JSON object keys
+def query_rollup(state, by=(), **filters):
+    rollup = shared_value(state, "rollup", compile.build_rollup)
+    if "start" in filters:
+        filters["start"] = parse_month(filters["start"])
+    if "end" in filters:
+        filters["end"] = parse_month(filters["end"])
+
+    results = compile.rollup_query(rollup, by=by, **filters)
+    return [{**dict(zip(by, key)), **totals} for key, totals in results.items()]
+
+QUERIES = {
+    "summarize": query_summarize,
+    "components": query_components,
+    "last_month": query_last_month,
+    "rollup": query_rollup,
+}
+
+def parse_month(value):
+    year, month = value.split("-")
+    return (int(year), int(month))
+
+def parse_bool(value):
+    return value.lower() in ("1", "true", "yes")
+
+def parse_by(value):
+    return tuple(dimension for dimension in value.split(",") if dimension)
+
+PARAMS = {
+    "year": int,
+    "month": int,
+    "top_k": int,
+    "rolling_duration": int,
+    "lates_only": parse_bool,
+    "by": parse_by,
+    "converting_type": str,
+    "part_num": str,
+    "component": str,
+    "start": str,
+    "end": str,
+}
+
+QUERY_PARAMS = {
+    "summarize": ["year"],
+    "components": ["top_k", "year"],
+    "last_month": ["rolling_duration", "year", "month"],
+    "rollup": ["by", "year", "month", "start", "end", "converting_type", "part_num", "component", "lates_only"],
+}
+
+# the query string as keyword arguments, only allowing the parameters the query takes
+def parse_params(name, query_string):
+    params = {}
+    for key, values in parse_qs(query_string).items():
+        if key not in QUERY_PARAMS[name]:
+            raise ValueError(f"Unknown parameter for {name}: {key}")
+        params[key] = PARAMS[key](values[-1])
+    return params
+
+class RequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def handle_request(self, method):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        name = url.path.strip("/")
+        cached = False
+
+        try:
+            if name == "status" and method == "GET":
+                status, result = 200, self.service.status()
+            elif name == "load" and method == "POST":
+                path = parse_qs(url.query).get("path")
+                if not path:
+                    raise ValueError("load needs a path parameter")
+                status, result = 200, self.service.load(path[-1])
+            elif name in QUERIES and method == "GET":
+                result, cached = self.service.query(name, parse_params(name, url.query))
+                status = 200
+            else:
+                status, result = 404, {"error": f"Unknown endpoint: {method} /{name}"}
+        except (ValueError, FileNotFoundError) as e:
+            status, result = 400, {"error": str(e)}
+        except Exception as e:
+            status, result = 500, {"error": repr(e)}
+
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+        body = json.dumps({"result": result, "cached": cached, "elapsed_ms": elapsed_ms}, default=compile.json_default).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Elapsed-Ms", str(elapsed_ms))
+        self.end_headers()
+        self.wfile.write(body)
+
+        print(f'{method} {self.path} {status} {elapsed_ms}ms{" (cached)" if cached else ""}')
+
+    # requests are logged with their latency in handle_request instead
+    def log_message(self, format, *args):
+        pass
+
+# load an export and serve queries on it until interrupted
+def serve(wb_name, host=HOST, port=PORT, cache_size=CACHE_SIZE):
+    service = AnalyticsService(cache_size)
+    service.load(wb_name)
+    handler = type("Handler", (RequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f'Serving {wb_name} on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve work order summaries from an export loaded once")
+    parser.add_argument("export")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    args = parser.parse_args()
+    serve(args.export, args.host, args.port, args.cache_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import calendar
+import datetime
+import sqlite3
+
+import compile
+
+WAREHOUSE_NAME = "warehouse.sqlite"
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_orders (
+    wo_num TEXT PRIMARY KEY,
+    part_num TEXT,
+    part_desc TEXT,
+    type TEXT,
+    status TEXT,
+    post_date TEXT,
+    due_date TEXT,
+    post_year INTEGER,
+    post_month INTEGER,
+    qty NUMERIC,
+    late_duration INTEGER,
+    is_late INTEGER,
+    is_slit INTEGER,
+    is_convert INTEGER
+);
+CREATE TABLE IF NOT EXISTS wo_components (
+    wo_num TEXT,
+    position INTEGER,
+    component TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_work_orders_post_date ON work_orders (post_date);
+CREATE INDEX IF NOT EXISTS idx_work_orders_slit ON work_orders (is_slit, is_late, post_year, post_month);
+CREATE INDEX IF NOT EXISTS idx_work_orders_convert ON work_orders (is_convert, is_late, post_year, post_month);
+CREATE INDEX IF NOT EXISTS idx_work_orders_year_month ON work_orders (post_year, post_month);
+CREATE INDEX IF NOT EXISTS idx_wo_components_wo_num ON wo_components (wo_num);
+"""
+
+# the report's converting groups, stored as flags at load time so their filters can use an index
+TYPE_GROUPS = ["slit", "convert"]
+
+# open (and create if needed) the warehouse database
+def open_warehouse(name=WAREHOUSE_NAME):
+    conn = sqlite3.connect(name)
+    conn.executescript(SCHEMA)
+    return conn
+
+def wo_row(wo):
+    post_date = wo["post_date"]
+    return (
+        wo["wo_num"],
+        wo["part_num"],
+        wo["part_desc"],
+        wo["type"],
+        wo["status"],
+        post_date.isoformat(sep=" "),
+        wo["due_date"].isoformat(sep=" "),
+        post_date.year,
+        post_date.month,
+        wo["qty"],
+        wo["late_duration"],
+        1 if wo["is_late"] else 0,
+        *(1 if compile.contains(group, wo["type"]) == True else 0 for group in TYPE_GROUPS),
+    )
+
+# bulk load a collect_data / load_data dataset into the warehouse in batches
+# a WO already in the warehouse is replaced by the newer copy, components included
+def load_warehouse(conn, data, batch_size=BATCH_SIZE):
+    raw = data["raw"]
+    with conn:
+        for start in range(0, len(raw), batch_size):
+            batch = raw[start:start + batch_size]
+            conn.executemany("DELETE FROM wo_components WHERE wo_num = ?", [(wo["wo_num"],) for wo in batch])
+            conn.executemany("INSERT OR REPLACE INTO work_orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [wo_row(wo) for wo in batch])
+            conn.executemany("INSERT INTO wo_components VALUES (?, ?, ?)", [
+                (wo["wo_num"], position, component)
+                for wo in batch
+                for position, component in enumerate(wo["components"] or [])
+            ])
+    print(f'Loaded {len(raw)} WOs into the warehouse')
+
+# the SQL condition matching compile.filter_data's converting_type / lates_only arguments
+def where_clause(converting_type=None, lates_only=False):
+    conditions = []
+    params = []
+    if lates_only:
+        conditions.append("is_late = 1")
+    if converting_type in TYPE_GROUPS:
+        conditions.append(f"is_{converting_type} = 1")
+    elif converting_type != None:
+        conditions.append("instr(lower(type), ?) > 0")
+        params.append(converting_type.lower())
+    if not conditions:
+        return "", params
+    return "WHERE " + " AND ".join(conditions), params
+
+# analyze_qty / analyze_late_duration style stats of a field for every year (or year and month)
+# medians are the middle row of each group by value, the same element analyze_qty picks
+def group_stats(conn, field, converting_type=None, lates_only=False, by_month=False):
+    where, params = where_clause(converting_type, lates_only)
+    group = "post_year, post_month" if by_month else "post_year"
+    width = 2 if by_month else 1
+
+    stats = {}
+    for row in conn.execute(f"SELECT {group}, COUNT(*), SUM({field}) FROM work_orders {where} GROUP BY {group}", params):
+        key = row[:width] if by_month else row[0]
+        wo_count, total = row[width], row[width + 1]
+        stats[key] = {
+            "wo_count": wo_count,
+            "sum": total,
+            "avg": round(total/wo_count,0),
+        }
+
+    medians = f"""
+        SELECT {group}, {field} FROM (
+            SELECT {group}, {field},
+                ROW_NUMBER() OVER (PARTITION BY {group} ORDER BY {field}) AS position,
+                COUNT(*) OVER (PARTITION BY {group}) AS size
+            FROM work_orders {where}
+        ) WHERE position = size / 2 + 1
+    """
+    for row in conn.execute(medians, params):
+        key = row[:width] if by_month else row[0]
+        stats[key]["median"] = row[width]
+
+    return stats
+
+# years in the order they first appear and the first/last post dates, like collect_data
+def warehouse_range(conn):
+    years_seen = [row[0] for row in conn.execute("SELECT post_year FROM work_orders GROUP BY post_year ORDER BY MIN(rowid)")]
+    first, last = conn.execute("SELECT MIN(post_date), MAX(post_date) FROM work_orders").fetchone()
+    return {
+        "years_seen": years_seen,
+        "first_date_seen": datetime.datetime.fromisoformat(first) if first else None,
+        "last_date_seen": datetime.datetime.fromisoformat(last) if last else None,
+    }
+
+def period_stats(qtys, late_qtys, late_durations, key):
+    return {
+        "wo_count": qtys[key]["wo_count"] if key in qtys else 0,
+        "qtys": qtys.get(key),
+        "late_count": late_qtys[key]["wo_count"] if key in late_qtys else 0,
+        "late_qtys": late_qtys.get(key),
+        "late_durations": late_durations.get(key),
+    }
+
+# compile.summarize computed with indexed GROUP BY queries instead of in Python
+def summarize_sql(conn):
+    data = warehouse_range(conn)
+    stats = {}
+    if not data["years_seen"]:
+        return stats
+
+    yearly = {}
+    monthly = {}
+    for converting_type in [None, "slit", "convert"]:
+        yearly[converting_type] = (
+            group_stats(conn, "qty", converting_type),
+            group_stats(conn, "qty", converting_type, True),
+            group_stats(conn, "late_duration", converting_type, True),
+        )
+        if converting_type:
+            monthly[converting_type] = (
+                group_stats(conn, "qty", converting_type, by_month=True),
+                group_stats(conn, "qty", converting_type, True, by_month=True),
+                group_stats(conn, "late_duration", converting_type, True, by_month=True),
+            )
+
+    for year in data["years_seen"]:
+        stats[year] = period_stats(*yearly[None], year)
+
+        for converting_type in ["slit", "convert"]:
+            stats[year][converting_type] = period_stats(*yearly[converting_type], year)
+            stats[year][converting_type]["months"] = {}
+
+            for num in range(1, 13):
+                # if the month and year are NOT within the date range then continue
+                if not compile.within_date_range(year, num, data["first_date_seen"].date(), data["last_date_seen"].date()):
+                    continue
+
+                month = calendar.month_name[num]
+                stats[year][converting_type]["months"][month] = {
+                    "month": month,
+                    "month_num": num,
+                    **period_stats(*monthly[converting_type], (year, num)),
+                }
+
+    return stats
+
+# compile.summarize_late_components with the counting done by one grouped query
+# components are ordered by first appearance within each month so ties match
+def summarize_late_components_sql(conn, top_k=None):
+    data = warehouse_range(conn)
+    if not data["years_seen"]:
+        return {}
+
+    counts = {}
+    query = """
+        SELECT w.post_year, w.post_month, c.component, COUNT(*), MIN(w.rowid * 10000 + c.position) AS first_seen
+        FROM wo_components c JOIN work_orders w ON w.wo_num = c.wo_num
+        WHERE w.is_late = 1
+        GROUP BY w.post_year, w.post_month, c.component
+        ORDER BY w.post_year, w.post_month, first_seen
+    """
+    for year, month, component, total, _ in conn.execute(query):
+        counts.setdefault((year, month), {})[compile.component_id(component)] = total
+
+    return compile.summarize_component_counts(counts, data, top_k)
+
+# per-month totals for the cube, one grouped query per converting group
+def monthly_totals_sql(conn):
+    monthly = {}
+    for group, converting_type in enumerate(compile.CUBE_GROUPS):
+        where, params = where_clause(converting_type if converting_type != "total" else None)
+        query = f"""
+            SELECT post_year, post_month, COUNT(*), SUM(qty), SUM(is_late),
+                SUM(CASE WHEN is_late = 1 THEN qty ELSE 0 END),
+                SUM(CASE WHEN is_late = 1 THEN late_duration ELSE 0 END)
+            FROM work_orders {where}
+            GROUP BY post_year, post_month
+        """
+        for year, month, *totals in conn.execute(query, params):
+            idx = compile.month_index(year, month)
+            if idx not in monthly:
+                monthly[idx] = [[0] * len(compile.CUBE_MEASURES) for _ in compile.CUBE_GROUPS]
+            monthly[idx][group] = totals
+
+    return monthly
+
+# compile.analyze_last_month answered from the month totals in the warehouse
+def analyze_last_month_sql(conn, rolling_duration):
+    last_month = compile.add_months(datetime.datetime.today(), -1)
+    cube = compile.cube_from_monthly(monthly_totals_sql(conn))
+    return compile.compare_month(cube, last_month.year, last_month.month, rolling_duration)
+
+# load an export into the warehouse and write the usual JSON summaries from it
+def main(wb_name, name=WAREHOUSE_NAME):
+    conn = open_warehouse(name)
+    load_warehouse(conn, compile.load_data(wb_name))
+    compile.print_to_json(summarize_sql(conn), "results")
+    compile.print_to_json(summarize_late_components_sql(conn), "components")
+    compile.print_to_json(analyze_last_month_sql(conn, 3), "last_month")
+    conn.close()
+
+if __name__ == "__main__":
+    main('~CRF096_December2024.xlsx')